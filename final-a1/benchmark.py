@@ -0,0 +1,283 @@
+'''Benchmark harness.
+
+    Runs every combination of search strategy x heuristic x weight (x fval
+    function, for the custom strategy) on a subset of PROBLEMS. Each run is a
+    separate process with its own time limit, and up to --jobs of them run at
+    once. One row per run is written as CSV or JSON, e.g.
+
+        python benchmark.py --problems 0-9 --strategies astar,custom \
+            --heuristics manhattan,alternate --weights 2,5 --jobs 4 -o runs.csv
+
+    A row holds the run's configuration, its status (solved, unsolved, timeout,
+    killed, error or skipped), the solution cost, the expansions and generations (as
+    counted for SearchStats), the wall and CPU time of the search and the peak
+    resident memory of the run's process. Diff the files produced before and
+    after a change to search.py or a heuristic to spot regressions.
+
+    Bidirectional search starts its backward half from every goal state a plan
+    can end in, and with several robots there can be hundreds of thousands of
+    them. Its runs on problems with more than --max-goal-states of them are
+    skipped (not run), with the status "skipped".
+
+    With --successors it instead times successor generation alone, on a
+    sample of the states of each problem, e.g.
+
+        python benchmark.py --successors --problems 0-19
+
+    and writes one row per problem (see SUCCESSOR_FIELDS).
+'''
+
+import argparse
+import csv
+import json
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import resource
+import sys
+import time
+from functools import partial
+from itertools import islice
+
+from search import SearchEngine, StateSpace, sNode
+from sokoban import PROBLEMS
+from solution import (sokoban_goal_state, heur_zero, heur_manhattan_distance, heur_alternate,
+                      heur_push_distance, heur_matching, fval_function, fval_function_XUP,
+                      fval_function_XDP)
+
+HEURISTICS = {
+    'zero': heur_zero,
+    'manhattan': heur_manhattan_distance,
+    'alternate': heur_alternate,
+    'push_distance': heur_push_distance,
+    'matching': heur_matching,
+}
+
+FVAL_FUNCTIONS = {
+    'standard': fval_function,
+    'xup': fval_function_XUP,
+    'xdp': fval_function_XDP,
+}
+
+STRATEGIES = ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom', 'idastar', 'bidirectional']
+
+#Strategies that ignore the heuristic, so they are run once per problem
+UNINFORMED = ['depth_first', 'breadth_first', 'ucs', 'bidirectional']
+
+FIELDS = ['problem', 'strategy', 'heuristic', 'fval', 'weight', 'status', 'cost',
+          'expanded', 'generated', 'wall_time', 'cpu_time', 'peak_memory_kb']
+
+#Default for --max-goal-states: bidirectional runs are skipped on problems
+#with more goal states than this (see SokobanState.goal_states)
+MAX_GOAL_STATES = 50000
+
+#Seconds a run may exceed its (wall clock) time limit before its process is killed
+GRACE = 2
+
+SUCCESSOR_FIELDS = ['problem', 'robots', 'boxes', 'states', 'successors', 'seconds', 'successors_per_sec']
+
+#States sampled (breadth first from the start) per problem for --successors
+SAMPLE_STATES = 2000
+
+def goal_state_count(problem, limit):
+    '''@return: The number of goal states of a problem, counting no further than limit + 1.'''
+    return sum(1 for goal in islice(PROBLEMS[problem].goal_states(), limit + 1))
+
+def grid(problems, strategies, heuristics, weights, fvals, max_goal_states=MAX_GOAL_STATES):
+    '''
+    @return: The list of run configurations (dicts of the first FIELDS) for the grid. A
+    bidirectional run on a problem with more than max_goal_states goal states already
+    has its status, skipped.
+    '''
+    runs = []
+    for problem in problems:
+        for strategy in strategies:
+            for heuristic in ([''] if strategy in UNINFORMED else heuristics):
+                if strategy == 'bidirectional' and goal_state_count(problem, max_goal_states) > max_goal_states:
+                    runs.append(dict(problem=problem, strategy=strategy, heuristic=heuristic,
+                                     fval='', weight='', status='skipped'))
+                elif strategy == 'custom':
+                    for fval in fvals:
+                        for weight in weights:
+                            runs.append(dict(problem=problem, strategy=strategy, heuristic=heuristic,
+                                             fval=fval, weight=weight))
+                else:
+                    runs.append(dict(problem=problem, strategy=strategy, heuristic=heuristic,
+                                     fval='', weight=''))
+    return runs
+
+def run(config, timeout):
+    '''Does one run (in the current process) and returns its row.'''
+    engine = SearchEngine(config['strategy'])
+    heur_fn = HEURISTICS[config['heuristic']] if config['heuristic'] else heur_zero
+    if config['strategy'] == 'custom':
+        engine.init_search(PROBLEMS[config['problem']], sokoban_goal_state, heur_fn,
+                           partial(FVAL_FUNCTIONS[config['fval']], weight=config['weight']))
+    else:
+        engine.init_search(PROBLEMS[config['problem']], sokoban_goal_state, heur_fn)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    goal, stats = engine.search(timeout)
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+
+    if goal:
+        status = 'solved'
+    elif cpu_time >= timeout:
+        status = 'timeout'
+    else:
+        status = 'unsolved'
+    #the same counters SearchStats reports, also available when the search failed
+    return dict(config, status=status, cost=goal.gval if goal else '',
+                expanded=sNode.n, generated=StateSpace.n,
+                wall_time=round(wall_time, 4), cpu_time=round(cpu_time, 4),
+                peak_memory_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def _run_child(config, timeout, connection):
+    #the engine's trace messages would end up in the output
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        row = run(config, timeout)
+    except Exception as e:
+        row = dict(config, status='error: {}'.format(e))
+    connection.send(row)
+    connection.close()
+
+def benchmark(runs, timeout, jobs=1):
+    '''
+    Does the runs, each in its own process, up to jobs at a time. The time limit
+    is on CPU time (like SearchEngine.search's timebound); with more jobs than
+    cpus a run gets a share of one, so its wall clock limit is stretched to
+    match. A run that hasn't reported GRACE seconds after that is killed. Runs
+    that already have a status (see grid) are not done.
+    @return: The rows of the runs, in the order of runs.
+    '''
+    wall_timeout = timeout * max(1, jobs / (os.cpu_count() or 1)) + GRACE
+    rows = [run if 'status' in run else None for run in runs]
+    pending = [index for index in range(len(runs)) if rows[index] is None]
+    running = dict()
+    while pending or running:
+        while pending and len(running) < jobs:
+            index = pending.pop(0)
+            receiver, sender = multiprocessing.Pipe(False)
+            process = multiprocessing.Process(target=_run_child, args=(runs[index], timeout, sender))
+            process.start()
+            sender.close()
+            running[index] = (process, receiver, time.perf_counter())
+
+        wait([receiver for process, receiver, start in running.values()], timeout=0.1)
+        for index, (process, receiver, start) in list(running.items()):
+            if receiver.poll():
+                try:
+                    rows[index] = receiver.recv()
+                except EOFError:
+                    rows[index] = dict(runs[index], status='error: process exited with code {}'.format(process.exitcode))
+            elif time.perf_counter() - start > wall_timeout:
+                process.kill()
+                rows[index] = dict(runs[index], status='killed', wall_time=round(time.perf_counter() - start, 4))
+            else:
+                continue
+            process.join()
+            receiver.close()
+            del running[index]
+    return rows
+
+def successor_rate(problem, seconds):
+    '''
+    Times iter_successors() on the first SAMPLE_STATES states of a breadth first
+    walk of a problem, cycling through them for about seconds (CPU time).
+    @return: The problem's row of SUCCESSOR_FIELDS.
+    '''
+    start = PROBLEMS[problem]
+    sample = [start]
+    seen = {start.hashable_state()}
+    for state in sample:
+        if len(sample) >= SAMPLE_STATES:
+            break
+        for succ in state.iter_successors():
+            if not succ.hashable_state() in seen and len(sample) < SAMPLE_STATES:
+                seen.add(succ.hashable_state())
+                #cut the parent link so the sample doesn't keep the walk's states alive
+                succ.parent = None
+                sample.append(succ)
+
+    generated = 0
+    cpu_start = time.process_time()
+    elapsed = 0
+    while elapsed < seconds:
+        for state in sample:
+            for succ in state.iter_successors():
+                generated += 1
+        elapsed = time.process_time() - cpu_start
+    return dict(problem=problem, robots=len(start.robots), boxes=len(start.boxes), states=len(sample),
+                successors=generated, seconds=round(elapsed, 4),
+                successors_per_sec=round(generated / elapsed))
+
+def write_rows(rows, out, format, fields=FIELDS):
+    if format == 'json':
+        json.dump(rows, out, indent=1)
+        out.write('\n')
+    else:
+        writer = csv.DictWriter(out, fields, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+
+def parse_problems(spec):
+    '''@return: The problem indices in a spec like "0-4,7,9".'''
+    problems = []
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            problems.extend(range(int(first), int(last) + 1))
+        else:
+            problems.append(int(part))
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark search strategies and heuristics on the Sokoban PROBLEMS.')
+    parser.add_argument('--problems', default='0-4', help='problem indices, e.g. "0-4,7" (default 0-4)')
+    parser.add_argument('--strategies', default='astar', help='comma separated, from: ' + ', '.join(STRATEGIES))
+    parser.add_argument('--heuristics', default='manhattan', help='comma separated, from: ' + ', '.join(HEURISTICS))
+    parser.add_argument('--weights', default='2', help='comma separated weights for the custom strategy')
+    parser.add_argument('--fvals', default='standard', help='comma separated fval functions for the custom strategy, from: ' + ', '.join(FVAL_FUNCTIONS))
+    parser.add_argument('--timeout', type=float, default=10, help='time limit of each run, in (CPU) seconds')
+    parser.add_argument('--max-goal-states', type=int, default=MAX_GOAL_STATES,
+                        help='skip bidirectional runs on problems with more goal states than this, as the '
+                             'backward search starts from all of them (default {})'.format(MAX_GOAL_STATES))
+    parser.add_argument('--successors', action='store_true',
+                        help='time successor generation instead (--timeout seconds per problem, no parallel jobs)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='runs done in parallel (default: the cpu count)')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    strategies = args.strategies.split(',')
+    heuristics = args.heuristics.split(',')
+    fvals = args.fvals.split(',')
+    for names, known in [(strategies, STRATEGIES), (heuristics, HEURISTICS), (fvals, FVAL_FUNCTIONS)]:
+        for name in names:
+            if not name in known:
+                parser.error('unknown name {!r}, must be one of {}'.format(name, ', '.join(known)))
+    problems = parse_problems(args.problems)
+    for problem in problems:
+        if not 0 <= problem < len(PROBLEMS):
+            parser.error('no problem {}, there are {}'.format(problem, len(PROBLEMS)))
+
+    if args.successors:
+        rows = [successor_rate(problem, args.timeout) for problem in problems]
+        fields = SUCCESSOR_FIELDS
+    else:
+        runs = grid(problems, strategies, heuristics, [float(w) for w in args.weights.split(',')], fvals,
+                    args.max_goal_states)
+        rows = benchmark(runs, args.timeout, args.jobs)
+        fields = FIELDS
+
+    if args.output:
+        with open(args.output, 'w', newline='') as out:
+            write_rows(rows, out, args.format, fields)
+    else:
+        write_rows(rows, sys.stdout, args.format, fields)
+
+if __name__ == '__main__':
+    main()
@@ -38,12 +38,28 @@
 
     '''
 import heapq
-from collections import deque
+import math
+from collections import deque, OrderedDict
+from collections.abc import MutableMapping
+from itertools import count
+import mmap
+import multiprocessing
+from queue import Empty
 import os
+import struct
+import sys
+import tempfile
+import time
 
 class StateSpace:
     '''Abstract class for defining State spaces for search routines'''
     n = 0
+    #successors a state space chose not to generate because another order
+    #of the same moves reaches the same state (see SokobanState.reduce_interleavings)
+    suppressed = 0
+    #Subclasses that declare __slots__ of their own get compact,
+    #dictionary free instances; subclasses that don't are unaffected.
+    __slots__ = ('action', 'gval', 'parent', 'index')
     
     def __init__(self, action, gval, parent):
         '''Problem specific state space objects must always include the data items
@@ -69,6 +85,32 @@ class StateSpace:
            Also any problem specific data must be specified property.'''        
         raise Exception("Must be overridden in subclass.")
 
+    def iter_successors(self):
+        '''Optional: the successors of successors(), generated one at a time.
+           The search loops consume successors through this, so a state space
+           can override it to avoid building the list. By default it iterates
+           over successors().'''
+        return iter(self.successors())
+
+    def predecessors(self):
+        '''Optional, only needed for bidirectional search. This method
+           must return a list of the states from which a single action
+           leads to self, each with "action" the action that leads from
+           it to self, "gval" the gval of self plus the cost of that
+           action, and parent set to self. (So along the backward search
+           gval is the cost of reaching a goal, and parent is the next
+           state on the way to it.)'''
+        raise Exception("Must be overridden in subclass.")
+
+    def goal_states(self):
+        '''Optional, only needed for bidirectional search. This method
+           must return (or generate) the goal states of self's problem,
+           each with gval 0 and no parent: every goal state an optimal
+           plan from a non-goal state can end in (it may leave out the
+           others). The backward half of bidirectional search starts
+           from these.'''
+        raise Exception("Must be overridden in subclass.")
+
     def hashable_state(self):
         '''This method must return an immutable and unique representation
            of the state represented by self. The return value, e.g., a
@@ -77,6 +119,13 @@ class StateSpace:
            if and only if obj1 and obj2 represent the same problem state.'''
         raise Exception("Must be overridden in subclass.")
 
+    def decode_state(self, key, action="START", gval=0, parent=None):
+        '''Optional, only needed for parallel search. This method must
+           return the state of self's problem whose hashable_state() is
+           key, with the given action, gval and parent. Parallel workers
+           exchange states as keys and rebuild them with this.'''
+        raise Exception("Must be overridden in subclass.")
+
     def print_state(self):
         '''Print a representation of the state'''
         raise Exception("Must be overridden in subclass.")
@@ -112,10 +161,12 @@ _BEST_FIRST = 2
 _ASTAR = 3
 _UCS = 4
 _CUSTOM = 5
+_IDASTAR = 6
+_BIDIRECTIONAL = 7
 
 #For best first and astar we use a priority queue. This requires
-#a comparison function for nodes. These constants indicate if we use
-#the gval, the hval or the sum of gval and hval in the comparison.
+#a priority key for nodes. These constants indicate if we use
+#the gval, the hval, the sum of gval and hval or the custom fval in the key.
 _SUM_HG = 0
 _H = 1
 _G = 2
@@ -128,6 +179,25 @@ _CC_NONE = 0
 _CC_PATH = 1
 _CC_FULL = 2
 
+#Frontier backends for the priority queue strategies. FRONTIER_LAZY
+#'lazy' pushes a new node every time a cheaper path to a state is found
+#and skips the stale copies when they are extracted. FRONTIER_INDEXED
+#'indexed' keeps a single entry per hashable_state() and updates it in
+#place (decrease-key), so the frontier never holds more than one node
+#per state.
+_FRONTIER_LAZY = 0
+_FRONTIER_INDEXED = 1
+
+#Clocks the timebound can be measured on: 'process' (the CPU time of this
+#process) or 'wall' (elapsed real time).
+_CLOCKS = {'process': time.process_time, 'wall': time.perf_counter}
+
+#Reading the clock is not free, so the search loops only check the time
+#bound every check_every nodes, adapting check_every so that checks are
+#about _CHECK_INTERVAL seconds apart (see SearchEngine._deadline_passed).
+_CHECK_INTERVAL = 0.002
+_MAX_CHECK_EVERY = 4096
+
 #Zero Heuristic Function---for uninformed search don't include heur_fn
 #in call to search engine's search method, defaults heur_fn to the zero fn.
 def _zero_hfn(state):
@@ -138,13 +208,309 @@ def _fval_function(state):
   '''default fval function results in Best First Search'''  
   return state.hval 
 
+class HeuristicCache:
+    '''Memoizing wrapper around a heuristic function. Values are cached
+       under key_fn(state), a user supplied projection of the state onto
+       the part the heuristic actually depends on (e.g. for a Sokoban
+       heuristic that only looks at the boxes, lambda s: s.boxes), so
+       states that differ elsewhere share one evaluation. At most maxsize
+       values are kept, evicting the least recently used one. hits and
+       misses count the lookups that were and weren't in the cache.
+
+       The projection must capture everything the heuristic reads,
+       otherwise states with different heuristic values get merged.'''
+
+    def __init__(self, heur_fn, key_fn, maxsize=100000):
+        self.heur_fn = heur_fn
+        self.key_fn = key_fn
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state):
+        key = self.key_fn(state)
+        cache = self.cache
+        if key in cache:
+            self.hits = self.hits + 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses = self.misses + 1
+        hval = self.heur_fn(state)
+        cache[key] = hval
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return hval
+
+#Slot flags of SpillingClosedList's disk table. A deleted slot is a
+#tombstone: lookups probe past it, inserts may reuse it. A used slot holds
+#a g-value, a record slot a path record (see compact_paths).
+_SLOT_EMPTY = 0
+_SLOT_USED = 1
+_SLOT_DELETED = 2
+_SLOT_RECORD = 3
+
+class SpillingClosedList(MutableMapping):
+    '''A cycle check dictionary (hashable_state() -> g-value, or the
+       (g-value, parent key, action) path records of compact_paths) that
+       keeps at most max_in_memory entries in a dict and spills the rest
+       to a hash table in a memory mapped temporary file (in directory, or
+       the system's default). The dict holds the hot set: a lookup that
+       finds its key on disk moves the entry back into it, and when it
+       outgrows max_in_memory its least recently used quarter is written out.
+
+       The disk table uses open addressing with linear probing over fixed
+       size slots (a flag, the g-value as a double, the key and, for a
+       path record, the parent key and the action), and is rebuilt at
+       twice the size when more than half full. Only int keys of at most
+       key_bytes bytes, such as those of SokobanState, can be spilled, and
+       only records whose action is a string of at most action_bytes bytes
+       (UTF-8); any other entry, and the initial state's record (it has no
+       parent key), stays in memory.
+
+       Select it with SearchEngine.set_closed('disk'), or with
+       set_closed(lambda: SpillingClosedList(...)) for other settings.'''
+
+    def __init__(self, max_in_memory=1000000, key_bytes=16, directory=None, capacity=1 << 16,
+                 action_bytes=16):
+        self.max_in_memory = max_in_memory
+        self.key_bytes = key_bytes
+        self.action_bytes = action_bytes
+        self.directory = directory
+        self.slot = struct.Struct('<Bd{0}s{0}s{1}s'.format(key_bytes, action_bytes))
+        self.hot = OrderedDict()
+        #entries that can't be written to the table
+        self.pinned = dict()
+        self.file = None
+        self.table = None
+        self.min_capacity = capacity
+        self.capacity = 0
+        self.used = 0
+        self.deleted = 0
+        #entries written out, and lookups answered from the table
+        self.spilled = 0
+        self.disk_hits = 0
+
+    def get(self, key, default=None):
+        value = self.hot.get(key)
+        if value is not None:
+            self.hot.move_to_end(key)
+            return value
+        if self.pinned:
+            value = self.pinned.get(key)
+            if value is not None:
+                return value
+        if self.table is not None:
+            value = self._disk_pop(key)
+            if value is not None:
+                self.disk_hits = self.disk_hits + 1
+                self.hot[key] = value
+                if len(self.hot) > self.max_in_memory:
+                    self._spill()
+                return value
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        hot = self.hot
+        if key in hot:
+            hot[key] = value
+            hot.move_to_end(key)
+            return
+        if key in self.pinned:
+            self.pinned[key] = value
+            return
+        if self.table is not None:
+            self._disk_pop(key)
+        hot[key] = value
+        if len(hot) > self.max_in_memory:
+            self._spill()
+
+    def __delitem__(self, key):
+        if key in self.hot:
+            del self.hot[key]
+        elif key in self.pinned:
+            del self.pinned[key]
+        elif self.table is None or self._disk_pop(key) is None:
+            raise KeyError(key)
+
+    def __len__(self):
+        return len(self.hot) + len(self.pinned) + self.used
+
+    def __iter__(self):
+        for key, value in self.items():
+            yield key
+
+    def items(self):
+        '''Generate the (key, value) pairs, reading spilled entries in
+           place (they are not moved back into memory).'''
+        yield from list(self.hot.items())
+        yield from list(self.pinned.items())
+        if self.table is not None:
+            table = self.table
+            for i in range(self.capacity):
+                if table[i * self.slot.size] in (_SLOT_USED, _SLOT_RECORD):
+                    yield self._unpack(table, i)
+
+    def close(self):
+        '''Release the disk table (the temporary file is deleted).'''
+        if self.table is not None:
+            self.table.close()
+            self.file.close()
+            self.table = None
+            self.file = None
+            self.capacity = self.used = self.deleted = 0
+
+    def _encode(self, key):
+        '''@return: key as the bytes stored in a slot, or None if it can't be stored'''
+        if type(key) is int and key >= 0 and key.bit_length() <= 8 * self.key_bytes:
+            return key.to_bytes(self.key_bytes, 'little')
+        return None
+
+    def _fields(self, key_bytes, value):
+        '''@return: The slot fields that store value under key_bytes, or None if it can't be stored'''
+        if type(value) is not tuple:
+            return _SLOT_USED, value, key_bytes, b'', b''
+        gval, parent_key, action = value
+        parent_bytes = self._encode(parent_key)
+        if parent_bytes is None or type(action) is not str:
+            return None
+        action_bytes = action.encode()
+        if len(action_bytes) > self.action_bytes or b'\0' in action_bytes:
+            return None
+        return _SLOT_RECORD, gval, key_bytes, parent_bytes, action_bytes
+
+    def _unpack(self, table, i):
+        '''@return: The key and value stored in slot i of table'''
+        flag, gval, key_bytes, parent_bytes, action_bytes = self.slot.unpack_from(table, i * self.slot.size)
+        key = int.from_bytes(key_bytes, 'little')
+        if flag == _SLOT_RECORD:
+            return key, (gval, int.from_bytes(parent_bytes, 'little'), action_bytes.rstrip(b'\0').decode())
+        return key, gval
+
+    def _find(self, key, key_bytes):
+        '''
+        Probe the table for key.
+        @return: The slot holding key (or -1), and the slot an insert of key would use.
+        '''
+        table, size = self.table, self.slot.size
+        mask = self.capacity - 1
+        #see _hda_owner: int keys' low bits alone would cluster
+        i = hash((key,)) & mask
+        free = -1
+        while True:
+            flag = table[i * size]
+            if flag == _SLOT_EMPTY:
+                return -1, i if free < 0 else free
+            if flag == _SLOT_DELETED:
+                if free < 0:
+                    free = i
+            elif table[i * size + 9:i * size + 9 + self.key_bytes] == key_bytes:
+                return i, i
+            i = (i + 1) & mask
+
+    def _disk_pop(self, key):
+        '''Remove key from the table. @return: Its value, or None if it wasn't there.'''
+        key_bytes = self._encode(key)
+        if key_bytes is None:
+            return None
+        i, _ = self._find(key, key_bytes)
+        if i < 0:
+            return None
+        value = self._unpack(self.table, i)[1]
+        self.table[i * self.slot.size] = _SLOT_DELETED
+        self.used = self.used - 1
+        self.deleted = self.deleted + 1
+        return value
+
+    def _spill(self):
+        '''Write the least recently used entries out, down to 3/4 of max_in_memory.'''
+        n = len(self.hot) - self.max_in_memory * 3 // 4
+        if 2 * (self.used + self.deleted + n) > self.capacity:
+            self._rebuild(self.used + n)
+        slot, table = self.slot, self.table
+        for _ in range(n):
+            key, value = self.hot.popitem(last=False)
+            key_bytes = self._encode(key)
+            fields = None if key_bytes is None else self._fields(key_bytes, value)
+            if fields is None:
+                self.pinned[key] = value
+                continue
+            _, i = self._find(key, key_bytes)
+            if table[i * slot.size] == _SLOT_DELETED:
+                self.deleted = self.deleted - 1
+            slot.pack_into(table, i * slot.size, *fields)
+            self.used = self.used + 1
+            self.spilled = self.spilled + 1
+
+    def _rebuild(self, entries):
+        '''Move the table to a new file with room for entries at most half full (dropping tombstones).'''
+        capacity = max(self.min_capacity, self.capacity)
+        while capacity < 2 * entries:
+            capacity = 2 * capacity
+        old_table, old_file, old_capacity = self.table, self.file, self.capacity
+        slot = self.slot
+        self.file = tempfile.TemporaryFile(dir=self.directory)
+        self.file.truncate(capacity * slot.size)
+        self.table = mmap.mmap(self.file.fileno(), capacity * slot.size)
+        self.capacity = capacity
+        self.used = 0
+        self.deleted = 0
+        if old_table is not None:
+            for i in range(old_capacity):
+                if old_table[i * slot.size] in (_SLOT_USED, _SLOT_RECORD):
+                    fields = slot.unpack_from(old_table, i * slot.size)
+                    _, j = self._find(int.from_bytes(fields[2], 'little'), fields[2])
+                    slot.pack_into(self.table, j * slot.size, *fields)
+                    self.used = self.used + 1
+            old_table.close()
+            old_file.close()
+
 class SearchStats:
 
-    def __init__(self, n1, n2, n3, n4):
+    def __init__(self, n1, n2, n3, n4, stale_pops=0, stale_pops_avoided=0,
+                 heur_cache_hits=0, heur_cache_misses=0, states_forgotten=0, states_reexpanded=0,
+                 worker_expansions=None, time_overshoot=None, deadline_checks=0,
+                 heur_calls_saved=0, lazy_reinsertions=0, states_suppressed=0):
         self.states_expanded = n1
         self.states_generated = n2
         self.states_pruned_cycles = n3      
         self.states_pruned_cost = n4     
+        #lazy frontier: extracted nodes skipped because a cheaper path
+        #to their state had already been found.
+        self.stale_pops = stale_pops
+        #indexed frontier: frontier entries updated in place instead of
+        #being pushed as duplicates (each one is a stale pop avoided).
+        self.stale_pops_avoided = stale_pops_avoided
+        #heuristic cache (see HeuristicCache): lookups answered from
+        #the cache and lookups that called the heuristic.
+        self.heur_cache_hits = heur_cache_hits
+        self.heur_cache_misses = heur_cache_misses
+        #memory bounded search: frontier nodes dropped to stay within the
+        #memory bound, and expansions of parents re-opened because of that.
+        self.states_forgotten = states_forgotten
+        self.states_reexpanded = states_reexpanded
+        #parallel search: expansions done by each worker, and the busiest
+        #worker's expansions relative to the mean (1.0 is perfect balance).
+        self.worker_expansions = worker_expansions
+        #time bound: seconds by which the search ran past it (None if it
+        #didn't stop on it), and the number of times the clock was read.
+        self.time_overshoot = time_overshoot
+        self.deadline_checks = deadline_checks
+        #lazy heuristic evaluation: successors whose heuristic was never
+        #computed, and nodes put back on OPEN because their real f was higher.
+        self.heur_calls_saved = heur_calls_saved
+        self.lazy_reinsertions = lazy_reinsertions
+        #successors not generated at all (see StateSpace.suppressed)
+        self.states_suppressed = states_suppressed
+        self.load_imbalance = None
+        if worker_expansions and sum(worker_expansions):
+            self.load_imbalance = max(worker_expansions) * len(worker_expansions) / sum(worker_expansions)
 
 class sNode:
     '''Object of this class form the nodes of the search space.  Each
@@ -154,7 +520,11 @@ class sNode:
     node object for convenience), and the number of the node'''
     
     n = 0
-    lt_type = _SUM_HG
+
+    #a lower bound on the node's priority key (its f, g, h or custom fval),
+    #backed up from forgotten successors by SearchEngine._forget_worst; it
+    #never changes hval. -inf: no bound (the node was not re-opened).
+    fbound = float('-inf')
     
     def __init__(self, state, hval, fval_function):
         self.state = state
@@ -164,103 +534,259 @@ class sNode:
         self.fval_function = fval_function
         sNode.n = sNode.n + 1
 
-    def __lt__(self, other):
-        '''For astar and best first we use a priority queue for the
-           OPEN set. This queue stores search nodes waiting to be
-           expanded. Thus we need to define a node1 < node2 function
-           by defining the __lt__ function. Dependent on the type of
-           search this comparison function compares the h-value, the
-           g-value or the f-value of the nodes. Note for the f-value
-           we wish to break ties by letting node1 < node2 if they both
-           have identical f-values but if node1 has a GREATER g
-           value. This means that we expand nodes along deeper paths
-           first causing the search to proceed directly to the goal'''
-                
-        if sNode.lt_type == _SUM_HG:
-            if (self.gval+self.hval) == (other.gval+other.hval):
-                #break ties by greatest gval. 
-                return self.gval > other.gval
-            else: return ((self.gval+self.hval) < (other.gval+other.hval))
-        if sNode.lt_type == _G:
-            return self.gval < other.gval
-        if sNode.lt_type == _H:
-            return self.hval < other.hval    
-        if sNode.lt_type == _C:  
-            return self.fval_function(self) <  other.fval_function(other)          
-        
-        print('sNode class has invalid comparator setting!')
-        
-        #return default of lowest gval (generating UCS behavior)
-        return self.gval < other.gval
-
 class Open:
     '''Open objects hold the search frontier---the set of unexpanded
        nodes. Depending on the search strategy used we want to extract
        nodes from this set in different orders, so set up the object's
        functions to operate as needed by the particular search
-       strategy'''
+       strategy.
+
+       For the priority queue strategies each node is given a priority
+       key once, when it is inserted, and the heap stores flat tuples
+       key + (node,). Dependent on the type of search the key holds the
+       g-value, the h-value, the f-value (g+h) or the custom fval of the
+       node, followed by tie-breakers so that nodes themselves are never
+       compared. For astar ties on f are broken by GREATER g-value, so
+       that nodes along deeper paths are expanded first, causing the
+       search to proceed directly to the goal, and then by insertion
+       order (FIFO). best_first and custom order on the h-value or the
+       custom fval alone and leave ties unordered, as sNode.__lt__ did:
+       the weighted fval functions are tuned for that order, and breaking
+       their ties by g changes which of many equal nodes comes first (and
+       can make weighted A* far slower). All comparisons are done on tuples
+       of numbers, and each Open carries its own ordering, so engines
+       using different strategies can coexist.'''
     
     def __init__(self, search_strategy):
+        self.counter = count()
         if search_strategy == _DEPTH_FIRST:
             #use stack for OPEN set (last in---most recent successor added---is first out)
             self.open = []
             self.insert = self.open.append
             self.extract = self.open.pop
+            self.key_type = None
         elif search_strategy == _BREADTH_FIRST:
             #use queue for OPEN (first in---earliest node not yet expanded---is first out)
             self.open = deque()
             self.insert = self.open.append
             self.extract = self.open.popleft
-        elif search_strategy == _UCS:
-            #use priority queue for OPEN (first out is node with lowest gval)
-            self.open = []
-            #set node less than function to compare gvals only
-            sNode.lt_type = _G
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)            
-        elif search_strategy == _BEST_FIRST:
-            #use priority queue for OPEN (first out is node with lowest hval)
-            self.open = []
-            #set node less than function to compare hvals only
-            sNode.lt_type = _H
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)
-        elif search_strategy == _ASTAR:
-            #use priority queue for OPEN (first out is node with lowest fval = gval+hval)
-            self.open = []
-            #set node less than function to compare sums of hval and gval
-            sNode.lt_type = _SUM_HG
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open) 
-        elif search_strategy == _CUSTOM:
-            #use priority queue for OPEN (first out is node with lowest fval)
+            self.key_type = None
+        else:
+            #use priority queue for OPEN. UCS: first out is node with
+            #lowest gval. BEST_FIRST: lowest hval. ASTAR: lowest
+            #fval = gval+hval. CUSTOM: lowest fval_function(node).
             self.open = []
-            #set node less than function to compare sums of fval    
-            sNode.lt_type = _C
-            self.insert = lambda node: heapq.heappush(self.open, node)
-            self.extract = lambda: heapq.heappop(self.open)          
+            if search_strategy == _UCS: self.key_type = _G
+            elif search_strategy == _BEST_FIRST: self.key_type = _H
+            elif search_strategy == _ASTAR: self.key_type = _SUM_HG
+            elif search_strategy == _CUSTOM: self.key_type = _C
+            self.insert = self._heap_insert
+            self.extract = self._heap_extract
+
+    def entry(self, node):
+        '''Return the heap entry key + (node,) for node'''
+        key_type = self.key_type
+        if key_type == _SUM_HG:
+            fval = node.gval + node.hval
+        elif key_type == _G:
+            fval = node.gval
+        elif key_type == _H:
+            fval = node.hval
+        else:
+            fval = node.fval_function(node)
+        #a parent re-opened by _forget_worst ranks with its forgotten successors
+        if fval < node.fbound:
+            fval = node.fbound
+        if key_type == _SUM_HG:
+            return (fval, -node.gval, next(self.counter), node)
+        if key_type == _G:
+            return (fval, next(self.counter), node)
+        #best_first and custom: ties are left unordered, as sNode.__lt__ left
+        #them, and heapq's own sifting decides which of equal nodes comes
+        #first. Tuples are ordered by their first unequal items; two fresh
+        #NaNs are never equal, and neither is below the other, so equal
+        #fvals compare as neither less nor greater and the node is never
+        #reached. An explicit (fval, counter) key would be FIFO instead,
+        #which the weighted fval functions are not tuned for: custom with
+        #weight 6 then no longer solves [17] in 30 seconds (4.6 s as is).
+        return (fval, float('nan'), node)
+
+    def _heap_insert(self, node):
+        heapq.heappush(self.open, self.entry(node))
+
+    def _heap_extract(self):
+        return heapq.heappop(self.open)[-1]
+
+    def truncate(self, n, spare=None):
+        '''Remove the n worst entries of a priority queue OPEN, passing
+           over the nodes for which spare(node) is true, and return the
+           (entry, node) pairs removed, worst last'''
+        entries = sorted(self.open)
+        kept = []
+        removed = []
+        for entry in reversed(entries):
+            if len(removed) < n and not (spare and spare(entry[-1])):
+                removed.append(entry)
+            else:
+                kept.append(entry)
+        #a sorted list is a valid heap
+        kept.reverse()
+        removed.reverse()
+        self.open[:] = kept
+        return [(entry, entry[-1]) for entry in removed]
+
+    def prune(self, keep):
+        '''Remove, in one pass, the nodes on OPEN for which keep(node) is
+           false and return them'''
+        kept = []
+        removed = []
+        for item in self.open:
+            node = item if self.key_type is None else item[-1]
+            if keep(node):
+                kept.append(item)
+            else:
+                removed.append(node)
+        if removed:
+            #in place, as insert and extract are bound to self.open
+            self.open.clear()
+            self.open.extend(kept)
+            if self.key_type is not None:
+                heapq.heapify(self.open)
+        return removed
+
+    def nodes(self):
+        '''Return the nodes on OPEN (in no particular order)'''
+        if self.key_type is None:
+            return list(self.open)
+        return [entry[-1] for entry in self.open]
 
     def empty(self): return not self.open
 
     def print_open(self):
         print("{", end="")
-        if len(self.open) == 1: 
-            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(self.open[0].state.index, self.open[0].state.action, self.open[0].state.hashable_state(), self.open[0].gval, self.open[0].hval, self.open[0].gval+self.open[0].hval), end="")
-        else:
-            for nd in self.open:
-                print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action, nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
+        for nd in self.nodes():
+            print("   <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(nd.state.index, nd.state.action, nd.state.hashable_state(), nd.gval, nd.hval, nd.gval+nd.hval), end="")
         print("}")
 
+    def __len__(self): return len(self.open)
+
+class IndexedOpen(Open):
+    '''Priority queue OPEN set with one entry per state. A handle
+       (the entry's position in the heap) is kept for every
+       hashable_state() on OPEN, so when a cheaper path to a state that
+       is already on OPEN is found its entry is replaced in place
+       (decrease-key) rather than pushed again. Only valid for the
+       priority queue strategies (ucs, best_first, astar and custom).'''
+
+    def __init__(self, search_strategy):
+        #let Open set up the priority key for this strategy
+        Open.__init__(self, search_strategy)
+        self.position = dict()
+        #number of inserts that updated (or were dominated by) the
+        #entry already on OPEN for the same state.
+        self.stale_pops_avoided = 0
+        self.insert = self._insert
+        self.extract = self._extract
+
+    def _insert(self, node):
+        hash_state = node.state.hashable_state()
+        i = self.position.get(hash_state)
+        if i is None:
+            self.open.append(self.entry(node))
+            self._sift_up(len(self.open) - 1)
+            return
+        #state already on OPEN: keep only the cheaper of the two paths
+        #(or, for a parent re-opened by _forget_worst, the lower f bound)
+        self.stale_pops_avoided = self.stale_pops_avoided + 1
+        old = self.open[i][-1]
+        if node.gval < old.gval or node.gval == old.gval and node.fbound < old.fbound:
+            self.open[i] = self.entry(node)
+            self._sift_up(i)
+            self._sift_down(self.position[hash_state])
+
+    def truncate(self, n, spare=None):
+        dropped = Open.truncate(self, n, spare)
+        self._reindex()
+        return dropped
+
+    def prune(self, keep):
+        removed = Open.prune(self, keep)
+        if removed:
+            self._reindex()
+        return removed
+
+    def _reindex(self):
+        self.position = dict()
+        for i, entry in enumerate(self.open):
+            self.position[entry[-1].state.hashable_state()] = i
+
+    def _extract(self):
+        heap = self.open
+        entry = heap[0]
+        last = heap.pop()
+        del self.position[entry[-1].state.hashable_state()]
+        if heap:
+            heap[0] = last
+            self._sift_down(0)
+        return entry[-1]
+
+    def _sift_up(self, i):
+        heap, position = self.open, self.position
+        entry = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not entry < heap[parent]:
+                break
+            heap[i] = heap[parent]
+            position[heap[i][-1].state.hashable_state()] = i
+            i = parent
+        heap[i] = entry
+        position[entry[-1].state.hashable_state()] = i
+
+    def _sift_down(self, i):
+        heap, position = self.open, self.position
+        n = len(heap)
+        entry = heap[i]
+        while True:
+            child = 2*i + 1
+            if child >= n:
+                break
+            if child + 1 < n and heap[child + 1] < heap[child]:
+                child = child + 1
+            if not heap[child] < entry:
+                break
+            heap[i] = heap[child]
+            position[heap[i][-1].state.hashable_state()] = i
+            i = child
+        heap[i] = entry
+        position[entry[-1].state.hashable_state()] = i
+
 class SearchEngine:
-    def __init__(self, strategy = 'depth_first', cc_level = 'default'):
+    def __init__(self, strategy = 'depth_first', cc_level = 'default', frontier = 'lazy', clock = 'process',
+                 closed = 'memory'):
         self.set_strategy(strategy, cc_level)
+        self.set_frontier(frontier)
+        self.set_clock(clock)
+        self.set_closed(closed)
+        self.set_hooks()
         self.trace = 0
 
     def initStats(self):
         sNode.n = 0
         StateSpace.n = 1    #initial state already generated on call so search
+        StateSpace.suppressed = 0
         self.cycle_check_pruned = 0
         self.cost_bound_pruned = 0
+        self.stale_pops = 0
+        self.states_forgotten = 0
+        self.states_reexpanded = 0
+        #backed up f-values of re-opened parents, by hashable_state()
+        self.forgotten = dict()
+        #compact_paths: forgotten states whose path records were kept
+        self.kept_records = set()
+        self.heur_calls_deferred = 0
+        self.heur_calls_made = 0
+        self.lazy_reinsertions = 0
 
     def trace_on(self, level = 1):
         '''For debugging, set tracking level 1 or 2'''
@@ -270,17 +796,34 @@ class SearchEngine:
         '''Turn off tracing'''
         self.trace = 0
 
+    def set_hooks(self, on_expand=None, on_generate=None, on_prune=None):
+        '''Install functions that the priority queue, depth first and breadth
+           first searches call on search events, e.g. to attach a profiler or
+           collect statistics: on_expand(node) before a node is expanded,
+           on_generate(node) after a successor's node is added to OPEN, and
+           on_prune(state, reason) when a successor is pruned by cycle checking
+           (reason 'cycle') or by the cost bound ('cost'), or an extracted node
+           is skipped because its state was reached more cheaply ('stale').
+           Call with no arguments to remove them.'''
+        self.on_expand = on_expand
+        self.on_generate = on_generate
+        self.on_prune = on_prune
+
     def set_strategy(self, s, cc = 'default'):
-        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom']:
+        if not s in ['depth_first', 'breadth_first', 'ucs', 'best_first', 'astar', 'custom', 'idastar', 'bidirectional']:
             print('Unknown search strategy specified:', s)
-            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom' or 'astar'")
+            print("Must be one of 'depth_first', 'ucs', 'breadth_first', 'best_first', 'custom', 'astar', 'idastar' or 'bidirectional'")
         elif not cc in ['default', 'none', 'path', 'full']:
             print('Unknown cycle check level', cc)
             print( "Must be one of ['default', 'none', 'path', 'full']")
 
+        elif s == 'bidirectional' and cc in ['none', 'path']:
+            #bidirectional search keeps the cheapest state reached per direction
+            #to detect where its two frontiers meet, which is full cycle checking.
+            raise ValueError("bidirectional search needs full cycle checking, not '{}'".format(cc))
         else:
             if cc == 'default' :
-                if s == 'depth_first' :
+                if s == 'depth_first' or s == 'idastar' :
                     self.cycle_check = _CC_PATH
                 else:
                     self.cycle_check = _CC_FULL
@@ -294,6 +837,41 @@ class SearchEngine:
             elif s == 'best_first'   : self.strategy = _BEST_FIRST
             elif s == 'astar'        : self.strategy = _ASTAR       
             elif s == 'custom' : self.strategy = _CUSTOM             
+            elif s == 'idastar'      : self.strategy = _IDASTAR
+            elif s == 'bidirectional': self.strategy = _BIDIRECTIONAL
+
+    def set_frontier(self, f):
+        '''Select the OPEN backend used by the priority queue strategies:
+           'lazy' (duplicates are skipped on extraction) or 'indexed'
+           (one entry per state, updated by decrease-key). depth_first
+           and breadth_first always use the lazy stack/queue.'''
+        if not f in ['lazy', 'indexed']:
+            print('Unknown frontier specified:', f)
+            print("Must be one of 'lazy' or 'indexed'")
+        elif f == 'lazy': self.frontier = _FRONTIER_LAZY
+        elif f == 'indexed': self.frontier = _FRONTIER_INDEXED
+
+    def set_clock(self, c):
+        '''Select the clock the timebound is measured on: 'process' (CPU
+           time used by this process) or 'wall' (elapsed real time).'''
+        if not c in _CLOCKS:
+            print('Unknown clock specified:', c)
+            print("Must be one of 'process' or 'wall'")
+        else:
+            self.clock = _CLOCKS[c]
+
+    def set_closed(self, c):
+        '''Select the cycle check dictionary used by full cycle checking:
+           'memory' (a dict), 'disk' (a SpillingClosedList, which spills
+           to a memory mapped file past a million entries) or a function
+           that returns a new, empty MutableMapping.'''
+        if callable(c):
+            self.new_closed = c
+        elif not c in ['memory', 'disk']:
+            print('Unknown closed list specified:', c)
+            print("Must be one of 'memory' or 'disk', or a function returning a MutableMapping")
+        elif c == 'memory': self.new_closed = dict
+        elif c == 'disk': self.new_closed = SpillingClosedList
 
     def get_strategy(self):
         if   self.strategy == _DEPTH_FIRST    : rval = 'depth_first'
@@ -302,6 +880,8 @@ class SearchEngine:
         elif self.strategy == _UCS          : rval = 'ucs' 
         elif self.strategy == _ASTAR          : rval = 'astar'      
         elif self.strategy == _CUSTOM          : rval = 'custom'   
+        elif self.strategy == _IDASTAR         : rval = 'idastar'
+        elif self.strategy == _BIDIRECTIONAL   : rval = 'bidirectional'
   
         rval = rval + ' with '
 
@@ -309,16 +889,45 @@ class SearchEngine:
         elif self.cycle_check == _CC_PATH : rval = rval + 'path checking'
         elif self.cycle_check == _CC_FULL : rval = rval + 'full cycle checking'
 
+        if self.frontier == _FRONTIER_INDEXED and not self.strategy in [_DEPTH_FIRST, _BREADTH_FIRST, _BIDIRECTIONAL]:
+            rval = rval + ' (indexed frontier)'
+
         return rval
 
-    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function):
+    def init_search(self, initState, goal_fn, heur_fn=_zero_hfn, fval_function=_fval_function,
+                    heur_cache_key=None, heur_cache_size=100000, lazy_heuristic=False,
+                    compact_paths=False):
         """
         Get ready to search. Call search on this object to run the search.
 
         @param initState: the state of the puzzle to start the search from.
         @param goal_fn: the goal function for the puzzle
-        @param heur_fn: the heuristic function to use (only relevant for search strategies that use heuristics)
+        @param heur_fn: the heuristic function to use (only relevant for search strategies that use heuristics).
+               If it has a reset() attribute, that is called first to drop anything it kept
+               from earlier searches.
         @param fval_fn: the f-value function (only relevant for custom search strategy)
+        @param heur_cache_key: if given, heur_fn is memoized on heur_cache_key(state) (see HeuristicCache)
+        @param heur_cache_size: the maximum number of cached heuristic values
+        @param lazy_heuristic: a cheap heuristic never above heur_fn (e.g. heur_push_distance
+               for heur_matching), to defer heur_fn until a node reaches the front of OPEN
+               (astar only). Successors go on OPEN with the larger of lazy_heuristic(succ) and
+               max(0, parent's h - step cost), a lower bound on their h when heur_fn is
+               consistent. When one is extracted its real h is computed and, if that puts it
+               behind the front of OPEN, it goes back on OPEN. Successors that are never
+               extracted never cost a heur_fn call. Incremental heuristics are not used.
+               On its own, the bound from the parent only gives a successor the parent's f,
+               so nearly every successor would reach the front of OPEN and be evaluated
+               anyway; the other strategies break ties among equal keys differently when
+               nodes are evaluated late, which can change what greedy search finds.
+        @param compact_paths: keep paths as (g-value, parent's hashable_state(), action) records,
+               stored as the values of the cycle check dictionary, instead of parent pointers:
+               a successor's parent is cut as soon as its h-value has been computed, and the
+               returned goal's path is rebuilt from the records (see _rebuild_path). A
+               heuristic evaluated later (lazy_heuristic) or an incremental one must not need
+               the parent; SokobanState records its last move in delta for them. Under a
+               memory_bound the records of forgotten states are kept (see _forget_worst).
+               Needs full cycle checking and a priority queue, depth first or breadth first
+               strategy.
         """
         #Perform full cycle checking as follows
         #a. check state before inserting into OPEN. If we had already reached
@@ -329,64 +938,365 @@ class SearchEngine:
         #   and if we have already expanded that state via a cheaper path
         #   we don't expand it. If we had expanded the state via a more
         #   expensive path, we re-expand it.
+
+        if getattr(initState, 'reduce_interleavings', False) and self.cycle_check == _CC_FULL:
+            raise ValueError("reduce_interleavings needs 'none' or 'path' cycle checking "
+                             "(see SokobanState.reduce_interleavings).")
         
         self.initStats()
 
+        reset = getattr(heur_fn, 'reset', None)
+        if reset is not None:
+            reset()
+
+        if heur_cache_key is not None:
+            heur_fn = HeuristicCache(heur_fn, heur_cache_key, heur_cache_size)
+
         #BEGIN TRACING
         if self.trace:
             print("   TRACE: Search Strategy: ", self.get_strategy())
             print("   TRACE: Initial State:", end="")
             initState.print_state()
         #END 
-        self.open = Open(self.strategy)
+        if self.strategy == _IDASTAR:
+            #IDA* keeps no OPEN set, only the current path; this stack just
+            #holds the root for tracing.
+            self.open = Open(_DEPTH_FIRST)
+        elif self.strategy == _BIDIRECTIONAL:
+            #two uniform cost frontiers, forward from initState and backward
+            #from the goal states
+            self.open = Open(_UCS)
+            self.back_open = Open(_UCS)
+        elif self.frontier == _FRONTIER_INDEXED and not self.strategy in [_DEPTH_FIRST, _BREADTH_FIRST]:
+            self.open = IndexedOpen(self.strategy)
+        else:
+            self.open = Open(self.strategy)
 
         node = sNode(initState, heur_fn(initState), fval_function)      
+        self.root_node = node
+        self.lazy_heuristic = False
+        self.lazy_bound = None
+        if lazy_heuristic and not (self.strategy == _ASTAR and callable(lazy_heuristic)):
+            print("lazy_heuristic needs astar and a cheap heuristic function; ignored.")
+        elif lazy_heuristic:
+            self.lazy_heuristic = True
+            self.lazy_bound = lazy_heuristic
+            #whether the node's hval is still the provisional bound
+            node.pending = False
+
+        self.compact_paths = False
+        if compact_paths and self.cycle_check != _CC_FULL:
+            print("compact_paths needs full cycle checking; ignored.")
+        elif compact_paths and not self.strategy in [_IDASTAR, _BIDIRECTIONAL]:
+            self.compact_paths = True
+        elif compact_paths:
+            print("compact_paths is not supported by {}; ignored.".format(self.get_strategy()))
 
         #the cycle check dictionary stores the cheapest path (g-val) found
-        #so far to a state. 
-        if self.cycle_check == _CC_FULL:
-            self.cc_dictionary = dict() 
-            self.cc_dictionary[initState.hashable_state()] = initState.gval
+        #so far to a state. IDA* only ever checks the current path, and
+        #bidirectional search keeps its own dictionaries (below).
+        if self.cycle_check == _CC_FULL and not self.strategy in [_IDASTAR, _BIDIRECTIONAL]:
+            self.cc_dictionary = self.new_closed()
+            if self.compact_paths:
+                self.cc_dictionary[initState.hashable_state()] = (initState.gval, None, initState.action)
+            else:
+                self.cc_dictionary[initState.hashable_state()] = initState.gval
+
+        if self.strategy == _BIDIRECTIONAL:
+            #for each direction, the cheapest state found so far per hashable_state()
+            self.forward_reached = {initState.hashable_state(): initState}
+            self.backward_reached = dict()
+            for goal in initState.goal_states():
+                if goal_fn(goal):
+                    self.backward_reached[goal.hashable_state()] = goal
+                    self.back_open.insert(sNode(goal, 0, fval_function))
         
         self.open.insert(node)
         self.fval_function = fval_function
         self.goal_fn = goal_fn
         self.heur_fn = heur_fn
 
-    def search(self, timebound=None, costbound=None):
+    def search(self, timebound=None, costbound=None, memory_bound=None):
         """
         Start searching, using the parameters set by init_search.
 
         @param timebound: the maximum amount of time, in seconds, to spend on this search.
         @param costbound: the cost bound 3-tuple for pruning, as specified in the assignment.
+        @param memory_bound: an (estimated) budget in bytes for OPEN plus the cycle check
+               dictionary. When it is exceeded the worst nodes on OPEN are forgotten (see
+               _forget_worst). Only used by the priority queue strategies.
 
-        This code will return a goal path (if one is found) as well as a SearchStat object containing
-        statistics about the given search (assuming a solution is found).
+        This code will return a goal path (if one is found), or False, as well as a SearchStat
+        object containing statistics about the given search.
         """
 
         goal_node = []
 
         ###NOW do the search and return the result
-        self.search_start_time = os.times()[0]
+        self.search_start_time = self.clock()
         self.search_stop_time = None
         if timebound:
             self.search_stop_time = self.search_start_time + timebound
-        goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
-
+        self.check_every = 1
+        self.last_check = self.search_start_time
+        self.deadline_checks = 0
+        self.time_overshoot = None
+        self.memory_bound = None
+        if memory_bound and self.strategy in [_UCS, _BEST_FIRST, _ASTAR, _CUSTOM]:
+            self.memory_bound = memory_bound
+        elif memory_bound:
+            print("memory_bound is only supported by the priority queue strategies; ignored.")
+        if self.strategy == _IDASTAR:
+            goal_node = self._searchIDAstar(self.goal_fn, self.heur_fn, costbound)
+        elif self.strategy == _BIDIRECTIONAL:
+            goal_node = self._searchBidirectional(costbound)
+        else:
+            goal_node = self._searchOpen(self.goal_fn, self.heur_fn, self.fval_function, costbound)
+
+        stats = SearchStats(sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned,
+                            self.stale_pops, getattr(self.open, 'stale_pops_avoided', 0),
+                            getattr(self.heur_fn, 'hits', 0), getattr(self.heur_fn, 'misses', 0),
+                            self.states_forgotten, self.states_reexpanded,
+                            time_overshoot=self.time_overshoot, deadline_checks=self.deadline_checks,
+                            heur_calls_saved=self.heur_calls_deferred - self.heur_calls_made,
+                            lazy_reinsertions=self.lazy_reinsertions,
+                            states_suppressed=StateSpace.suppressed)
         if goal_node:
-            total_search_time = os.times()[0] - self.search_start_time
-            stats = SearchStats(sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned)
-            #print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, total_search_time))
-            #print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-            #    sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
+            #print("Solution Found with cost of {} in search time of {} sec".format(goal_node.gval, self.clock() - self.search_start_time))
+            if self.compact_paths:
+                return self._rebuild_path(goal_node.state), stats
             return goal_node.state, stats
         else:
             #exited the while without finding goal---search failed
-            total_search_time = os.times()[0] - self.search_start_time            
             #print("Search Failed! No solution found.")
-            #print("Nodes expanded = {}, states generated = {}, states cycle check pruned = {}, states cost bound pruned = {}".format(
-            #    sNode.n, StateSpace.n, self.cycle_check_pruned, self.cost_bound_pruned))
+            return False, stats
+
+    def tighten_costbound(self, costbound):
+        """
+        Prune what a search under the new, tighter, cost bound would never admit,
+        so that resuming the search (e.g. after a solution was found) doesn't
+        expand nodes admitted under the old bound. One pass over OPEN removes the
+        nodes that fail the bound (tested like successors in _searchOpen), and one
+        pass over the cycle check dictionary removes their entries and any other
+        entry whose g-value is over costbound[0] (entries keep no h-value). IDA*
+        and bidirectional search keep no frontier between calls to search, so
+        there is nothing to prune for them.
+
+        @param costbound: the cost bound 3-tuple, as specified in the assignment.
+        Returns the number of nodes removed from OPEN.
+        """
+        if self.strategy in [_IDASTAR, _BIDIRECTIONAL]:
+            return 0
+        removed = self.open.prune(lambda node: not (node.gval > costbound[0] or
+                                                    node.hval > costbound[1] or
+                                                    node.gval + node.hval > costbound[2]))
+        self.cost_bound_pruned = self.cost_bound_pruned + len(removed)
+        if self.cycle_check == _CC_FULL:
+            compact = self.compact_paths
+            removed_gvals = dict()
+            #a removed node's path record may still lead to states expanded
+            #before it (those over the g bound go, and all their descendants with them)
+            if not compact:
+                for node in removed:
+                    removed_gvals[node.state.hashable_state()] = node.gval
+            #deleted in place, so the closed list keeps its backend (see set_closed)
+            doomed = [hash_state for hash_state, value in self.cc_dictionary.items()
+                      if (value[0] if compact else value) > costbound[0] or removed_gvals.get(hash_state) == value]
+            for hash_state in doomed:
+                del self.cc_dictionary[hash_state]
+
+        #BEGIN TRACING
+        if self.trace:
+            print("   TRACE: Cost bound tightened to {}, {} nodes pruned from OPEN".format(costbound, len(removed)))
+        #END TRACING
+        return len(removed)
+
+    def iter_solutions(self, timebound=None, costbound=None, prune_on_f=False):
+        """
+        Anytime search: resume search, using the parameters set by init_search, and
+        yield (goal state, SearchStat object) for successively cheaper solutions,
+        until no cheaper one exists or timebound runs out (in total, over all of
+        them). After each solution the cost bound is tightened (see
+        tighten_costbound) to exclude paths costing as much: on their g-value, or
+        on g + h if prune_on_f is true (only valid with an admissible heuristic,
+        but it prunes much earlier).
+
+        @param timebound: the maximum amount of time, in seconds, to spend on all the searches.
+        @param costbound: the initial cost bound 3-tuple (default: no bound).
+        @param prune_on_f: bound g + h rather than g after each solution.
+        """
+        INF = float('inf')
+        if costbound is None:
+            costbound = (INF, INF, INF)
+        stop_time = None
+        if timebound:
+            stop_time = self.clock() + timebound
+
+        while True:
+            remaining = None
+            if stop_time is not None:
+                remaining = stop_time - self.clock()
+                if remaining <= 0:
+                    return
+            goal, stats = self.search(remaining, costbound)
+            if not goal:
+                return
+            yield goal, stats
+
+            #the largest bound below goal.gval, so that equal costs are pruned too
+            bound = math.nextafter(goal.gval, -INF)
+            if prune_on_f:
+                costbound = (costbound[0], costbound[1], bound)
+            else:
+                costbound = (bound, costbound[1], costbound[2])
+            self.tighten_costbound(costbound)
+
+    def parallel_search(self, timebound=None, costbound=None, workers=None, batch_size=64):
+        """
+        Hash distributed A* (HDA*), using the parameters set by init_search (astar
+        or ucs only). Each state is owned by one worker (chosen by hashing hashable_state()),
+        which keeps its own OPEN and closed dictionary and is the only one to expand
+        the states it owns. Successors are sent to their owners in batches of
+        (key, gval, parent key, action) records and rebuilt there with
+        decode_state(), so the states must implement it. The best goal found so far
+        is shared, and nodes whose f is no better than it are dropped. The search is
+        over once every worker is idle and every record sent has been received; with
+        an admissible heuristic the goal found is then optimal. If the time bound runs
+        out first, the best goal found by then is returned all the same, but it is not
+        known to be optimal (stats.time_overshoot is then set, as when search stops on
+        its time bound).
+
+        Workers are separate processes, so keys that are strings need the 'fork'
+        start method (string hashes differ between spawned processes).
+
+        @param timebound: the maximum amount of (wall clock) time, in seconds, to search.
+        @param costbound: the cost bound 3-tuple for pruning, as specified in the assignment.
+        @param workers: the number of worker processes (default: the cpu count).
+        @param batch_size: records buffered per destination before they are sent.
+
+        Returns the goal state (or False if none was found) and a SearchStat object
+        with worker_expansions and load_imbalance. Strategies other than astar and
+        ucs are refused with False and None.
+        """
+        if not self.strategy in [_ASTAR, _UCS]:
+            print("parallel_search only supports the astar and ucs strategies.")
             return False, None
+        n = workers or os.cpu_count() or 1
+        root = self.root_node.state
+
+        inboxes = [multiprocessing.Queue() for i in range(n)]
+        results = multiprocessing.Queue()
+        #records sent by each worker (the last slot is this process) and received
+        sent = multiprocessing.Array('q', n + 1, lock=False)
+        received = multiprocessing.Array('q', n, lock=False)
+        idle = multiprocessing.Array('b', n, lock=False)
+        stop = multiprocessing.Value('b', 0, lock=False)
+        best_cost = multiprocessing.Value('d', float('inf'))
+        processes = [multiprocessing.Process(target=_hda_worker,
+                                             args=(i, n, root, self.goal_fn, self.heur_fn, self.strategy,
+                                                   costbound, batch_size, inboxes, results, sent, received,
+                                                   idle, stop, best_cost))
+                     for i in range(n)]
+        for process in processes:
+            process.start()
+
+        def receive():
+            #the next message from the workers, or an exception if one of them crashed
+            while True:
+                try:
+                    return results.get(timeout=0.1)
+                except Empty:
+                    if any(process.exitcode for process in processes):
+                        stop.value = 1
+                        raise Exception("parallel_search: a worker process failed.")
+
+        key = root.hashable_state()
+        sent[n] = 1
+        inboxes[_hda_owner(key, n)].put([(key, root.gval, None, root.action)])
+
+        search_start_time = time.perf_counter()
+        search_stop_time = search_start_time + timebound if timebound else None
+        goal = None
+        time_overshoot = None
+        previous = None
+        while True:
+            try:
+                message = results.get(timeout=0.01)
+                if message[0] == 'goal' and (goal is None or message[1] < goal[0]):
+                    goal = message[1:]
+                continue
+            except Empty:
+                pass
+            if search_stop_time and time.perf_counter() > search_stop_time:
+                #exceeded time bound, must terminate search
+                print("TRACE: Search has exceeeded the time bound provided.")
+                time_overshoot = time.perf_counter() - search_stop_time
+                break
+            #terminated once two successive snapshots find every worker idle and
+            #the same (balanced) record counts: the counts only grow, so nothing
+            #was sent or received in between
+            snapshot = (all(idle), sum(sent), sum(received))
+            if snapshot[0] and snapshot[1] == snapshot[2] and snapshot == previous:
+                break
+            previous = snapshot
+        stop.value = 1
+
+        #rebuild the solution path by asking each state's owner for its record
+        #(the owners keep their closed dictionaries after a timeout too)
+        records = []
+        if goal:
+            key = goal[1]
+            while key is not None:
+                inboxes[_hda_owner(key, n)].put(('record', key))
+                message = receive()
+                while message[0] != 'record':
+                    message = receive()
+                records.append(message[1:])
+                key = message[3]
+
+        for inbox in inboxes:
+            inbox.put(None)
+        worker_stats = [None] * n
+        while None in worker_stats:
+            message = receive()
+            if message[0] == 'stats':
+                worker_stats[message[1]] = message[2:]
+        for process in processes:
+            process.join()
+
+        stats = SearchStats(sum(w[0] for w in worker_stats), sum(w[1] for w in worker_stats),
+                            sum(w[2] for w in worker_stats), sum(w[3] for w in worker_stats),
+                            worker_expansions=[w[0] for w in worker_stats],
+                            time_overshoot=time_overshoot)
+        if not records:
+            return False, stats
+        state = None
+        for key, gval, parent_key, action in reversed(records):
+            state = root.decode_state(key, action, gval, state)
+        return state, stats
+
+    def _deadline_passed(self):
+        """
+        Read the clock and return True if the time bound has passed (recording by
+        how much in self.time_overshoot). Otherwise set self.check_every, the number
+        of nodes to process before the next check, from the rate measured since the
+        last one: enough for about _CHECK_INTERVAL seconds, but no more than half
+        the time left, so the bound is overshot by at most a few milliseconds.
+        """
+        now = self.clock()
+        self.deadline_checks = self.deadline_checks + 1
+        if now > self.search_stop_time:
+            self.time_overshoot = now - self.search_stop_time
+            return True
+        per_node = (now - self.last_check) / self.check_every
+        self.last_check = now
+        if per_node > 0:
+            every = int(min(_CHECK_INTERVAL, (self.search_stop_time - now) / 2) / per_node)
+        else:
+            #too fast for the clock's resolution
+            every = 2 * self.check_every
+        self.check_every = max(1, min(every, _MAX_CHECK_EVERY))
+        return False
 
     def _searchOpen(self, goal_fn, heur_fn, fval_function, costbound):
         """
@@ -397,13 +1307,168 @@ class SearchEngine:
         @param fval_function: the f-value function (only relevant when using a custom search strategy).
         @param costbound: the cost bound 3-tuple, as described in the assignment.
         """
+        if self.trace or self.memory_bound or self.on_expand or self.on_generate or self.on_prune:
+            return self._searchOpenInstrumented(goal_fn, heur_fn, fval_function, costbound)
+        return self._searchOpenFast(goal_fn, heur_fn, costbound)
+
+    def _searchOpenFast(self, goal_fn, heur_fn, costbound):
+        """
+        The search loop of _searchOpen when there is no tracing, no hook and no
+        memory bound: the same search as _searchOpenInstrumented, with the
+        engine's settings read into locals once rather than tested per node.
+        """
+        open = self.open
+        #the list or deque behind open, emptied and refilled in place only
+        frontier = open.open
+        extract = open.extract
+        insert = open.insert
+        full = self.cycle_check == _CC_FULL
+        path_check = self.cycle_check == _CC_PATH
+        cc = self.cc_dictionary if full else None
+        forgotten = self.forgotten
+        incremental = getattr(heur_fn, 'incremental', None)
+        lazy = self.lazy_heuristic
+        lazy_bound = self.lazy_bound
+        compact = self.compact_paths
+        countdown = 0
+        stale_pops = 0
+        cycle_check_pruned = 0
+        cost_bound_pruned = 0
+
+        try:
+            while frontier:
+                node = extract()
+                state = node.state
+
+                if goal_fn(state):
+                    #node at front of OPEN is a goal...search is completed.
+                    return node
+
+                if self.search_stop_time: #timebound check, every check_every nodes
+                    countdown = countdown - 1
+                    if countdown <= 0:
+                        if self._deadline_passed():
+                            #exceeded time bound, must terminate search
+                            print("TRACE: Search has exceeeded the time bound provided.")
+                            return False
+                        countdown = self.check_every
+
+                if full:
+                    state_key = state.hashable_state()
+                    cc_gval = cc.get(state_key)
+                    if compact:
+                        cc_gval = cc_gval[0]
+                    if cc_gval is None:
+                        #entry dropped by _forget_worst while this node was on OPEN
+                        cc[state_key] = node.gval
+                    elif cc_gval < node.gval:
+                        stale_pops = stale_pops + 1
+                        continue
+
+                if forgotten and state.hashable_state() in forgotten:
+                    del forgotten[state.hashable_state()]
+                    self.states_reexpanded = self.states_reexpanded + 1
+
+                if lazy and node.pending:
+                    if self._evaluate_pending(node, heur_fn, costbound):
+                        continue
+
+                fval_function = node.fval_function
+                for succ in state.iter_successors():
+                    if full:
+                        hash_state = succ.hashable_state()
+                        cc_gval = cc.get(hash_state)
+                        if cc_gval is not None and succ.gval > (cc_gval[0] if compact else cc_gval):
+                            cycle_check_pruned = cycle_check_pruned + 1
+                            continue
+                    elif path_check and succ.has_path_cycle():
+                        cycle_check_pruned = cycle_check_pruned + 1
+                        continue
+
+                    if lazy:
+                        succ_hval = max(0, node.hval - (succ.gval - node.gval), lazy_bound(succ))
+                    elif incremental is None:
+                        succ_hval = heur_fn(succ)
+                    else:
+                        succ_hval = incremental(state, node.hval, succ)
+                        if succ_hval is None:
+                            succ_hval = heur_fn(succ)
+                    if costbound is not None and (succ.gval > costbound[0] or
+                                                  succ_hval > costbound[1] or
+                                                  succ.gval + succ_hval > costbound[2]) :
+                        cost_bound_pruned = cost_bound_pruned + 1
+                        continue
+
+                    if compact:
+                        succ.parent = None
+                    if lazy:
+                        succ_node = sNode(succ, succ_hval, fval_function)
+                        succ_node.pending = True
+                        self.heur_calls_deferred = self.heur_calls_deferred + 1
+                        insert(succ_node)
+                    else:
+                        insert(sNode(succ, succ_hval, fval_function))
+                    if compact:
+                        cc[hash_state] = (succ.gval, state_key, succ.action)
+                    elif full:
+                        cc[hash_state] = succ.gval
+
+            #end of while--OPEN is empty and no solution
+            return False
+        finally:
+            self.stale_pops = self.stale_pops + stale_pops
+            self.cycle_check_pruned = self.cycle_check_pruned + cycle_check_pruned
+            self.cost_bound_pruned = self.cost_bound_pruned + cost_bound_pruned
+
+    def _evaluate_pending(self, node, heur_fn, costbound):
+        """
+        Replace the provisional h-value of a node pushed with lazy_heuristic by
+        its real one. Returns True if the node must not be expanded now: it is
+        over the cost bound (and dropped), or its priority went up past the
+        front of OPEN, so it has been put back on OPEN at its proper place.
+        """
+        node.pending = False
+        self.heur_calls_made = self.heur_calls_made + 1
+        hval = heur_fn(node.state)
+        if costbound is not None and (hval > costbound[1] or node.gval + hval > costbound[2]):
+            self.cost_bound_pruned = self.cost_bound_pruned + 1
+            return True
+        raised = hval > node.hval
+        node.hval = hval
+        #still no worse than anything on OPEN: expand it right away
+        if raised and self.open.open and self.open.entry(node)[0] > self.open.open[0][0]:
+            self.lazy_reinsertions = self.lazy_reinsertions + 1
+            self.open.insert(node)
+            return True
+        return False
+
+    def _searchOpenInstrumented(self, goal_fn, heur_fn, fval_function, costbound):
+        """
+        The search loop of _searchOpen with tracing, the event hooks (see
+        set_hooks) and the memory bound.
+        """
         #BEGIN TRACING
         if self.trace:
             print("   TRACE: Initial OPEN: ", self.open.print_open())
             if self.cycle_check == _CC_FULL:
                 print("   TRACE: Initial CC_Dict:", self.cc_dictionary)
         #END TRACING
+
+        #A heuristic can offer an incremental form, heur_fn.incremental(parent,
+        #parent_hval, state), that derives the h-value of a successor from its
+        #parent's (or returns None to fall back to heur_fn).
+        incremental = getattr(heur_fn, 'incremental', None)
+
+        if self.memory_bound:
+            open_bytes, closed_bytes = self._entry_bytes(self.open.nodes()[0])
+        countdown = 0
+
         while not self.open.empty():
+            if self.memory_bound:
+                closed = len(self.cc_dictionary) if self.cycle_check == _CC_FULL else 0
+                if len(self.open) * open_bytes + closed * closed_bytes > self.memory_bound:
+                    self._forget_worst(open_bytes, closed_bytes, heur_fn)
+
             node = self.open.extract()
 
             #BEGIN TRACING
@@ -418,11 +1483,14 @@ class SearchEngine:
               #node at front of OPEN is a goal...search is completed.
               return node
 
-            if self.search_stop_time: #timebound check
-              if os.times()[0] > self.search_stop_time:                
-                #exceeded time bound, must terminate search
-                print("TRACE: Search has exceeeded the time bound provided.")
-                return False
+            if self.search_stop_time: #timebound check, every check_every nodes
+              countdown = countdown - 1
+              if countdown <= 0:
+                if self._deadline_passed():
+                  #exceeded time bound, must terminate search
+                  print("TRACE: Search has exceeeded the time bound provided.")
+                  return False
+                countdown = self.check_every
 
              #All states reached by a search node on OPEN have already
              #been hashed into the self.cc_dictionary. However,
@@ -434,13 +1502,39 @@ class SearchEngine:
             #BEGIN TRACING
             if self.trace:
                 if self.cycle_check == _CC_FULL: print("   TRACE: CC_dict gval={}, node.gval={}".format(
-                    self.cc_dictionary[node.state.hashable_state()], node.gval))
+                    self.cc_dictionary.get(node.state.hashable_state()), node.gval))
             #END TRACING
 
-            if self.cycle_check == _CC_FULL and self.cc_dictionary[node.state.hashable_state()] < node.gval:
-                continue
+            if self.cycle_check == _CC_FULL:
+                cc_gval = self.cc_dictionary.get(node.state.hashable_state())
+                if self.compact_paths:
+                    cc_gval = cc_gval[0]
+                if cc_gval is None:
+                    #entry dropped by _forget_worst while this node was on OPEN
+                    self.cc_dictionary[node.state.hashable_state()] = node.gval
+                elif cc_gval < node.gval:
+                    self.stale_pops = self.stale_pops + 1
+                    if self.on_prune:
+                        self.on_prune(node.state, 'stale')
+                    continue
+
+            reexpanding = False
+            if self.forgotten and node.state.hashable_state() in self.forgotten:
+                #a parent re-opened after some of its successors were forgotten
+                del self.forgotten[node.state.hashable_state()]
+                self.states_reexpanded = self.states_reexpanded + 1
+                reexpanding = True
 
-            successors = node.state.successors()
+            if self.lazy_heuristic and node.pending:
+                if self._evaluate_pending(node, heur_fn, costbound):
+                    continue
+
+            if self.on_expand:
+                self.on_expand(node)
+            if self.trace:
+                successors = node.state.successors()
+            else:
+                successors = node.state.iter_successors()
 
             #BEGIN TRACING
             if self.trace:
@@ -472,9 +1566,17 @@ class SearchEngine:
                         print("   TRACE: On cyclic path")
                 #END TRACING
 
-                prune_succ = (self.cycle_check == _CC_FULL and
-                              hash_state in self.cc_dictionary and
-                              succ.gval > self.cc_dictionary[hash_state]
+                cc_gval = None
+                if self.cycle_check == _CC_FULL:
+                    cc_gval = self.cc_dictionary.get(hash_state)
+                    if self.compact_paths and cc_gval is not None:
+                        cc_gval = cc_gval[0]
+                #a re-expanded parent only needs the successors that were
+                #forgotten: the others still have their cycle check entries
+                #(or, with compact_paths, entries not marked as kept_records)
+                prune_succ = (cc_gval is not None and
+                              (succ.gval > cc_gval or
+                               reexpanding and succ.gval == cc_gval and not hash_state in self.kept_records)
                              ) or (
                               self.cycle_check == _CC_PATH and
                               succ.has_path_cycle()
@@ -482,6 +1584,8 @@ class SearchEngine:
 
                 if prune_succ :
                     self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    if self.on_prune:
+                        self.on_prune(succ, 'cycle')
                     #BEGIN TRACING
                     if self.trace > 1:
                         print(" TRACE: Successor State pruned by cycle checking")
@@ -489,18 +1593,36 @@ class SearchEngine:
                     #END TRACING
                     continue
 
-                succ_hval = heur_fn(succ)
+                if self.lazy_heuristic:
+                    succ_hval = max(0, node.hval - (succ.gval - node.gval), self.lazy_bound(succ))
+                elif incremental is None:
+                    succ_hval = heur_fn(succ)
+                else:
+                    succ_hval = incremental(node.state, node.hval, succ)
+                    if succ_hval is None:
+                        succ_hval = heur_fn(succ)
                 if costbound is not None and (succ.gval > costbound[0] or
                                               succ_hval > costbound[1] or
                                               succ.gval + succ_hval > costbound[2]) : 
                     self.cost_bound_pruned = self.cost_bound_pruned + 1
+                    if self.on_prune:
+                        self.on_prune(succ, 'cost')
                     if self.trace > 1:
                       print(" TRACE: Successor State pruned, over current cost bound of {}", costbound)
                       print("\n") 
                     continue                    
 
                 #passed all cycle checks and costbound checks ...add to open
-                self.open.insert(sNode(succ, succ_hval, node.fval_function))
+                if self.compact_paths:
+                    succ.parent = None
+                    self.kept_records.discard(hash_state)
+                succ_node = sNode(succ, succ_hval, node.fval_function)
+                if self.lazy_heuristic:
+                    succ_node.pending = True
+                    self.heur_calls_deferred = self.heur_calls_deferred + 1
+                self.open.insert(succ_node)
+                if self.on_generate:
+                    self.on_generate(succ_node)
 
                 #BEGIN TRACING
                 if self.trace > 1:
@@ -509,9 +1631,509 @@ class SearchEngine:
                 #END TRACING
 
                 #record cost of this path in dictionary.
-                if self.cycle_check == _CC_FULL:
+                if self.compact_paths:
+                    self.cc_dictionary[hash_state] = (succ.gval, node.state.hashable_state(), succ.action)
+                elif self.cycle_check == _CC_FULL:
                     self.cc_dictionary[hash_state] = succ.gval
 
         #end of while--OPEN is empty and no solution
         return False
             
+
+    def _entry_bytes(self, node):
+        """
+        Estimate the bytes held by one OPEN entry (heap tuple, node and state,
+        including the state's immediate built-in members) and by one cycle
+        check dictionary entry. Objects shared between states are not counted.
+        """
+        def sizeof(obj):
+            return sys.getsizeof(obj) + sys.getsizeof(getattr(obj, '__dict__', None) or 0)
+
+        state = node.state
+        members = list(getattr(state, '__dict__', {}).values())
+        for cls in type(state).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(state, name):
+                    members.append(getattr(state, name))
+        open_bytes = sys.getsizeof((0, 0, 0, node)) + sizeof(node) + sizeof(state)
+        for member in members:
+            if isinstance(member, (int, float, str, tuple, frozenset)):
+                open_bytes = open_bytes + sys.getsizeof(member)
+                if isinstance(member, (tuple, frozenset)):
+                    open_bytes = open_bytes + sum(sys.getsizeof(m) for m in member)
+        #key object plus (amortized) hash table slot
+        closed_bytes = sys.getsizeof(state.hashable_state()) + 3 * 8 * 2
+        if self.compact_paths:
+            #the path record (its parent key is the parent's own key object)
+            closed_bytes = closed_bytes + sys.getsizeof((0, 0, 0)) + sys.getsizeof(state.action)
+        return open_bytes, closed_bytes
+
+    def _forget_worst(self, open_bytes, closed_bytes, heur_fn):
+        """
+        SMA* style memory reduction. Forget the worst entries on OPEN (which are
+        all leaves of the search tree) until the estimated memory is 90% of the
+        bound. A forgotten node's cycle check entry is removed so its state can be
+        regenerated, and its parent is put back on OPEN so that the forgotten
+        subtree can be re-expanded later, with its priority key (f, g, h or the
+        custom fval) backed up to the least key among its forgotten successors
+        (in sNode.fbound, so its h and anything derived from it stay admissible).
+        Nodes without a parent (such as the root) and the parents re-opened by
+        this call are never forgotten. Redundant entries are dropped first: stale
+        ones (states since reached more cheaply) and all but one of the entries
+        for a state at the same g-value.
+
+        With compact_paths a forgotten node's path record stays (it may be on the
+        path of states expanded before), so only its OPEN entry is freed; its state
+        goes in kept_records instead, and parents are decoded from the records.
+        """
+        target = 0.9 * self.memory_bound
+        full = self.cycle_check == _CC_FULL
+        compact = self.compact_paths
+        reopened = set()
+
+        if full:
+            #the entry kept per state: the cheapest, and of those the one with
+            #the lowest bound (a plain node expands everything a re-opened one would)
+            best = dict()
+            for node in self.open.nodes():
+                hash_state = node.state.hashable_state()
+                other = best.get(hash_state)
+                if other is None or (node.gval, node.fbound) < (other.gval, other.fbound):
+                    best[hash_state] = node
+            cc_dictionary = self.cc_dictionary
+            def fresh(node):
+                cc_gval = cc_dictionary.get(node.state.hashable_state())
+                if compact:
+                    cc_gval = cc_gval[0]
+                return (cc_gval is None or cc_gval >= node.gval) and best[node.state.hashable_state()] is node
+            self.open.prune(fresh)
+
+        if compact:
+            def spare(node):
+                return id(node) in reopened or cc_dictionary[node.state.hashable_state()][1] is None
+        else:
+            def spare(node):
+                return node.state.parent is None or id(node) in reopened
+
+        while True:
+            closed = len(self.cc_dictionary) if full else 0
+            excess = len(self.open) * open_bytes + closed * closed_bytes - target
+            if excess <= 0:
+                break
+            #each forgotten leaf frees its OPEN entry and (unless compact) its cycle check entry
+            n = int(excess // (open_bytes + (closed_bytes if full and not compact else 0))) + 1
+            dropped = self.open.truncate(n, spare)
+            if not dropped:
+                #everything left on OPEN must be kept
+                break
+            reopen = dict()
+            for entry, node in dropped:
+                self.states_forgotten = self.states_forgotten + 1
+                state = node.state
+                hash_state = state.hashable_state()
+                if compact:
+                    self.kept_records.add(hash_state)
+                    parent = None
+                    parent_hash = self.cc_dictionary[hash_state][1]
+                else:
+                    if full and self.cc_dictionary.get(hash_state) == node.gval:
+                        del self.cc_dictionary[hash_state]
+                    parent = state.parent
+                    parent_hash = parent.hashable_state()
+                if node.fbound > float('-inf'):
+                    #a parent re-opened earlier: its forgotten successors are
+                    #now reached through its own parent
+                    self.forgotten.pop(hash_state, None)
+                #the node's key, including any bound backed up to it
+                fval = entry[0]
+                if parent_hash in reopen:
+                    reopen[parent_hash][1] = min(reopen[parent_hash][1], fval)
+                else:
+                    reopen[parent_hash] = [parent, fval]
+
+            for parent_hash, (parent, fval) in reopen.items():
+                if parent_hash in self.forgotten and self.forgotten[parent_hash] <= fval:
+                    #already back on OPEN with a bound at least as low
+                    continue
+                self.forgotten[parent_hash] = fval
+                if compact:
+                    gval, _, action = self.cc_dictionary[parent_hash]
+                    parent = self.root_node.state.decode_state(parent_hash, action, gval)
+                elif full and self.cc_dictionary.get(parent_hash, parent.gval) >= parent.gval:
+                    self.cc_dictionary[parent_hash] = parent.gval
+                parent_node = sNode(parent, heur_fn(parent), self.fval_function)
+                parent_node.fbound = fval
+                if self.lazy_heuristic:
+                    parent_node.pending = False
+                reopened.add(id(parent_node))
+                self.open.insert(parent_node)
+
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Memory bound exceeded, forgot {} nodes and re-opened {} parents".format(len(dropped), len(reopen)))
+            #END TRACING
+
+    def _searchIDAstar(self, goal_fn, heur_fn, costbound):
+        """
+        Iterative deepening A*, starting from the root node set by init_search.
+
+        Each iteration is a depth-first search that cuts off nodes whose
+        f = g + h exceeds the current bound; the next bound is the smallest
+        f that was cut off. Only the current path (and the unexplored
+        successors of the states on it) is kept in memory, and cycles are
+        checked against the states on that path (unless cycle checking is
+        'none'). With an admissible heuristic the first goal found is optimal.
+
+        @param goal_fn: the goal function.
+        @param heur_fn: the heuristic function.
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+        """
+        INF = float('inf')
+        root = self.root_node
+        incremental = getattr(heur_fn, 'incremental', None)
+        path_check = self.cycle_check != _CC_NONE
+        bound = root.gval + root.hval
+        countdown = 0
+
+        while bound < INF:
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: IDA* iteration with f bound", bound)
+            #END TRACING
+            next_bound = INF
+            on_path = set()
+            #each entry is [node, iterator over its successors (None until expanded)]
+            stack = [[root, None]]
+
+            while stack:
+                top = stack[-1]
+                node = top[0]
+
+                if top[1] is None:
+                    fval = node.gval + node.hval
+                    if fval > bound:
+                        next_bound = min(next_bound, fval)
+                        stack.pop()
+                        continue
+
+                    if goal_fn(node.state):
+                        return node
+
+                    if self.search_stop_time: #timebound check, every check_every nodes
+                        countdown = countdown - 1
+                        if countdown <= 0:
+                            if self._deadline_passed():
+                                #exceeded time bound, must terminate search
+                                print("TRACE: Search has exceeeded the time bound provided.")
+                                return False
+                            countdown = self.check_every
+
+                    #BEGIN TRACING
+                    if self.trace:
+                        print("   TRACE: Next State to expand: <S{}:{}:{}, g={}, h={}, f=g+h={}>".format(
+                            node.state.index, node.state.action, node.state.hashable_state(), node.gval, node.hval, fval))
+                    #END TRACING
+
+                    if path_check:
+                        on_path.add(node.state.hashable_state())
+                    top[1] = node.state.iter_successors()
+
+                child = None
+                for succ in top[1]:
+                    if path_check and succ.hashable_state() in on_path:
+                        self.cycle_check_pruned = self.cycle_check_pruned + 1
+                        continue
+
+                    if incremental is None:
+                        succ_hval = heur_fn(succ)
+                    else:
+                        succ_hval = incremental(node.state, node.hval, succ)
+                        if succ_hval is None:
+                            succ_hval = heur_fn(succ)
+                    if costbound is not None and (succ.gval > costbound[0] or
+                                                  succ_hval > costbound[1] or
+                                                  succ.gval + succ_hval > costbound[2]) :
+                        self.cost_bound_pruned = self.cost_bound_pruned + 1
+                        continue
+
+                    child = sNode(succ, succ_hval, node.fval_function)
+                    break
+
+                if child is None:
+                    #all successors done: backtrack
+                    if path_check:
+                        on_path.discard(node.state.hashable_state())
+                    stack.pop()
+                else:
+                    stack.append([child, None])
+
+            bound = next_bound
+
+        #no node was cut off by the bound---the space is exhausted, no solution
+        return False
+
+    def _searchBidirectional(self, costbound):
+        """
+        Bidirectional uniform cost search: one frontier grows forward from the
+        initial state (successors) and one backward from the goal states
+        (predecessors), always expanding the smaller of the two. Every state
+        generated in one direction is looked up in the other direction's
+        dictionary; the cheapest such meeting gives a solution, which is
+        optimal once the two frontiers' least g-values add up to its cost.
+        The heuristic is not used.
+
+        @param costbound: the cost bound 3-tuple, as described in the assignment.
+               Only its f bound (costbound[2]) applies: states further than it
+               from either end, and meetings costing more, are pruned.
+        """
+        INF = float('inf')
+        opens = (self.open, self.back_open)
+        reached = (self.forward_reached, self.backward_reached)
+        bound = INF if costbound is None else costbound[2]
+        best = INF
+        meeting = None
+        countdown = 0
+
+        root = self.root_node.state
+        if self.goal_fn(root):
+            #goal_states() need not yield the goal the search starts on
+            best = 0
+            meeting = (root, root)
+
+        while not opens[0].empty() and not opens[1].empty():
+            #UCS heap entries start with the node's g-value
+            if opens[0].open[0][0] + opens[1].open[0][0] >= best:
+                break
+
+            if self.search_stop_time: #timebound check, every check_every nodes
+                countdown = countdown - 1
+                if countdown <= 0:
+                    if self._deadline_passed():
+                        #exceeded time bound, must terminate search
+                        print("TRACE: Search has exceeeded the time bound provided.")
+                        return False
+                    countdown = self.check_every
+
+            d = 0 if len(opens[0]) <= len(opens[1]) else 1
+            node = opens[d].extract()
+            if reached[d][node.state.hashable_state()].gval < node.gval:
+                self.stale_pops = self.stale_pops + 1
+                continue
+
+            #BEGIN TRACING
+            if self.trace:
+                print("   TRACE: Next State to expand ({}): <S{}:{}:{}, g={}>".format(
+                    "forward" if d == 0 else "backward",
+                    node.state.index, node.state.action, node.state.hashable_state(), node.gval))
+            #END TRACING
+
+            if d == 0:
+                neighbours = node.state.iter_successors()
+            else:
+                neighbours = node.state.predecessors()
+
+            for succ in neighbours:
+                hash_state = succ.hashable_state()
+                old = reached[d].get(hash_state)
+                if old is not None and old.gval <= succ.gval:
+                    self.cycle_check_pruned = self.cycle_check_pruned + 1
+                    continue
+                if succ.gval > bound:
+                    self.cost_bound_pruned = self.cost_bound_pruned + 1
+                    continue
+
+                reached[d][hash_state] = succ
+                opens[d].insert(sNode(succ, 0, node.fval_function))
+
+                other = reached[1 - d].get(hash_state)
+                if other is not None and succ.gval + other.gval < best and succ.gval + other.gval <= bound:
+                    best = succ.gval + other.gval
+                    meeting = (succ, other) if d == 0 else (other, succ)
+                    #BEGIN TRACING
+                    if self.trace:
+                        print("   TRACE: Frontiers meet, solution cost", best)
+                    #END TRACING
+
+        if meeting is None:
+            return False
+        return sNode(self._join_paths(*meeting), 0, self.fval_function)
+
+    def _join_paths(self, forward, backward):
+        """
+        Splice the backward half of a bidirectional solution onto its forward
+        half. forward and backward represent the same state; the states on
+        backward's parent chain (which leads to a goal) are rewired so that each
+        one's parent, action and gval describe the forward path from the
+        initial state. Returns the goal state at the end of the joined path.
+        """
+        chain = []
+        s = backward
+        while s is not None:
+            chain.append(s)
+            s = s.parent
+        #read the backward actions and costs before any state is rewired
+        steps = [(chain[i + 1], chain[i].action, chain[i].gval - chain[i + 1].gval)
+                 for i in range(len(chain) - 1)]
+        state = forward
+        for succ, action, cost in steps:
+            succ.parent = state
+            succ.action = action
+            succ.gval = state.gval + cost
+            state = succ
+        return state
+
+    def _rebuild_path(self, goal):
+        """
+        Rebuild the path of a goal found with compact_paths. The keys and actions
+        on it are read from the path records, back to the initial state, and the
+        path is replayed from there, each step by the successor with the recorded
+        key and action. A record can be replaced by a cheaper path to its state
+        after its successors were recorded, so the records' g-values needn't add
+        up; the replayed states' do, and the goal's is never above goal.gval.
+        Returns the goal state at the end of the rebuilt path.
+        """
+        steps = []
+        key = goal.hashable_state()
+        _, parent_key, action = self.cc_dictionary[key]
+        while parent_key is not None:
+            steps.append((key, action))
+            key = parent_key
+            _, parent_key, action = self.cc_dictionary[key]
+        state = self.root_node.state
+        for key, action in reversed(steps):
+            for succ in state.iter_successors():
+                if succ.action == action and succ.hashable_state() == key:
+                    break
+            state = succ
+        return state
+
+def _hda_owner(key, n):
+    '''The worker, of n, that owns the state with hashable_state() key. Hashing
+       the key inside a tuple mixes its bits, so int keys whose low bits are
+       mostly equal (e.g. bitboards) still spread evenly.'''
+    return hash((key,)) % n
+
+def _hda_worker(i, n, root, goal_fn, heur_fn, strategy, costbound, batch_size,
+                inboxes, results, sent, received, idle, stop, best_cost):
+    """
+    Worker i of n in SearchEngine.parallel_search. Receives batches of records for
+    the states it owns, expands the best of them and routes the successors to their
+    owners, until told to stop; then answers requests for the records on the
+    solution path, and finally reports its statistics.
+    """
+    inbox = inboxes[i]
+    open = Open(strategy)
+    #hashable_state() -> (gval, parent's hashable_state(), action) of the cheapest path found
+    closed = dict()
+    outboxes = [[] for j in range(n)]
+    #records of our own successors, which never go through a queue
+    own = []
+    expanded = 0
+    generated = 0
+    cycle_check_pruned = 0
+    cost_bound_pruned = 0
+    since_flush = 0
+    #a request that arrived before we saw the stop flag
+    message = False
+
+    while not stop.value:
+        try:
+            if open.empty():
+                batch = inbox.get(timeout=0.01)
+            else:
+                batch = inbox.get_nowait()
+        except Empty:
+            batch = False
+        if batch is not False and not isinstance(batch, list):
+            message = batch
+            break
+        from_inbox = batch is not False
+        if batch is False and own:
+            batch, own = own, []
+
+        if batch is not False:
+            if from_inbox:
+                #not idle from before the records are counted as received
+                idle[i] = 0
+            for key, gval, parent_key, action in batch:
+                old = closed.get(key)
+                if old is not None and old[0] <= gval:
+                    cycle_check_pruned = cycle_check_pruned + 1
+                    continue
+                state = root.decode_state(key, action, gval)
+                generated = generated + 1
+                hval = heur_fn(state)
+                if costbound is not None and (gval > costbound[0] or
+                                              hval > costbound[1] or
+                                              gval + hval > costbound[2]) :
+                    cost_bound_pruned = cost_bound_pruned + 1
+                    continue
+                closed[key] = (gval, parent_key, action)
+                open.insert(sNode(state, hval, None))
+            if from_inbox:
+                received[i] = received[i] + len(batch)
+            continue
+
+        node = None
+        while not open.empty():
+            node = open.extract()
+            if closed[node.state.hashable_state()][0] < node.gval or node.gval + node.hval >= best_cost.value:
+                #stale, or can't beat the best goal found so far
+                node = None
+            else:
+                break
+
+        if node is None:
+            #nothing to expand: send everything buffered and wait for records
+            for j in range(n):
+                if outboxes[j]:
+                    sent[i] = sent[i] + len(outboxes[j])
+                    inboxes[j].put(outboxes[j])
+                    outboxes[j] = []
+            idle[i] = 1
+            continue
+
+        key = node.state.hashable_state()
+        if goal_fn(node.state):
+            with best_cost.get_lock():
+                if node.gval < best_cost.value:
+                    best_cost.value = node.gval
+                    results.put(('goal', node.gval, key))
+            continue
+
+        expanded = expanded + 1
+        for succ in node.state.iter_successors():
+            succ_key = succ.hashable_state()
+            owner = _hda_owner(succ_key, n)
+            if owner == i:
+                own.append((succ_key, succ.gval, key, succ.action))
+                continue
+            outboxes[owner].append((succ_key, succ.gval, key, succ.action))
+            if len(outboxes[owner]) >= batch_size:
+                sent[i] = sent[i] + len(outboxes[owner])
+                inboxes[owner].put(outboxes[owner])
+                outboxes[owner] = []
+
+        #bound the latency of records to lightly loaded owners
+        since_flush = since_flush + 1
+        if since_flush >= batch_size:
+            since_flush = 0
+            for j in range(n):
+                if outboxes[j]:
+                    sent[i] = sent[i] + len(outboxes[j])
+                    inboxes[j].put(outboxes[j])
+                    outboxes[j] = []
+
+    while True:
+        if message is False:
+            message = inbox.get()
+        if message is None:
+            break
+        if isinstance(message, tuple) and message[0] == 'record':
+            results.put(('record', message[1]) + closed[message[1]])
+        message = False
+
+    results.put(('stats', i, expanded, generated, cycle_check_pruned, cost_bound_pruned))
+    #unread batches may still be queued for other workers; don't block exit on them
+    for q in inboxes:
+        q.cancel_join_thread()
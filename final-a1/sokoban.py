@@ -4,7 +4,24 @@
 
     A specializion of the StateSpace Class that is tailored to the game of Sokoban.
 
-    B) class Direction
+    B) class SokobanLevel
+
+    The static part of a Sokoban problem (dimensions, storage, obstacles), shared by
+    all the states of that problem, together with tables derived from it (cell numbering,
+    neighbour tables, walking distances, dead squares) that heuristics can reuse.
+
+    C) class PackedSokobanState
+
+    An optional compact version of SokobanState that stores robots as cell indices
+    and boxes as an int bitboard.
+
+    D) class MacroSokobanState
+
+    A SokobanState whose successors are box pushes: the robot's walk to the box is
+    folded into the move (and its cost), so walking alone never makes a new state.
+    For levels with one robot only.
+
+    E) class Direction
 
     An encoding of the directions of movement that are possible for robots in Sokoban.
 
@@ -12,9 +29,30 @@
 '''
 
 from search import *
+from functools import cached_property
+from itertools import combinations, permutations
 
 class SokobanState(StateSpace):
 
+    #All the static map data is reached through the shared level.
+    __slots__ = ('level', 'robots', 'boxes', 'key', 'delta')
+
+    #When True, successors() does not generate pushes that put a box on one of
+    #the level's dead squares (see SokobanLevel.dead_squares). Such states can
+    #never reach the goal, so this only removes hopeless branches.
+    prune_dead_pushes = False
+
+    #When True, successors() does not generate a move of a robot right after
+    #an independent move of a higher numbered robot: the two touch no common
+    #cell, so making them in the other order reaches the same state at the
+    #same cost, and that order is the one kept. Each such move is counted in
+    #StateSpace.suppressed. This never loses a state as long as a state that
+    #is reached again is searched again ('none' or 'path' cycle checking).
+    #Full cycle checking keeps one path per state, and that path decides which
+    #moves the state may make next, so the state's only canonical way forward
+    #could be pruned: SearchEngine.init_search refuses the combination.
+    reduce_interleavings = False
+
     def __init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles):
         '''
         Creates a new Sokoban state.
@@ -26,71 +64,208 @@ class SokobanState(StateSpace):
         @param obstacles: A frozenset of all the impassable obstacles.
         '''
         StateSpace.__init__(self, action, gval, parent)
-        self.width = width
-        self.height = height
+        self.level = get_level(width, height, storage, obstacles)
         self.robots = robots
         self.boxes = boxes
-        self.storage = storage
-        self.obstacles = obstacles    
+        #encoded hashable_state(), filled in on first use (or by successors)
+        self.key = None
+        #the move that generated this state from its parent (see child)
+        self.delta = None
+
+    def child(self, action, gval, robots, boxes, key=None, delta=None):
+        '''
+        Creates a state of the same level with self as its parent. Cheaper than the
+        constructor, which has to look the level up from the static map data.
+        @param delta: The move from self, as a (robot index, robot's old cell, old box cell,
+        new box cell) tuple; the box cells are -1 when no box was pushed. Incremental
+        heuristics use it to update the parent's value instead of recomputing it, and
+        reduce_interleavings to tell which cells the last move touched, so neither needs
+        the parent (which SearchEngine's compact_paths option cuts).
+        '''
+        state = object.__new__(type(self))
+        state.action = action
+        state.gval = gval
+        state.parent = self
+        state.index = StateSpace.n
+        StateSpace.n = StateSpace.n + 1
+        state.level = self.level
+        state.robots = robots
+        state.boxes = boxes
+        state.key = key
+        state.delta = delta
+        return state
+
+    @property
+    def width(self): return self.level.width
+
+    @property
+    def height(self): return self.level.height
+
+    @property
+    def storage(self): return self.level.storage
+
+    @property
+    def obstacles(self): return self.level.obstacles
 
     def successors(self):
         '''
         Generates all the actions that can be performed from this state, and the states those actions will create.        
         '''
-        successors = []
+        return list(self.iter_successors())
+
+    def iter_successors(self):
+        '''
+        Generates the successors of successors() one at a time. Each move is checked against the
+        level's step table and the box bitboard first, so nothing is allocated for illegal moves;
+        a legal one shares the unchanged robot locations. The boxes are always copied (see below).
+        '''
+        level = self.level
+        step = level.step
+        locations = level.locations
+        gval = self.gval + 1
+        robots = self.robots
+        boxes = self.boxes
+        robot_cells = tuple(level.cell(robot) for robot in robots)
+        dead_bits = level.dead_bits if self.prune_dead_pushes else 0
+
+        #the child's key differs from ours in one robot field and, for a
+        #push, two box bits, so it is derived here instead of re-encoded.
+        #The box bitboard is the key's low bits.
+        key = self.hashable_state()
+        box_bits = key & ((1 << level.size) - 1)
+
+        #cells touched by the move that made this state (see reduce_interleavings)
+        last_robot = -1
+        if self.reduce_interleavings and self.delta is not None:
+            last_robot, last_cell, _, last_box = self.delta
+            last_cells = {last_cell, robot_cells[last_robot], last_box}
+            last_cells.discard(-1)
+
+        for robot in range(0, len(robots)):
+            cell = robot_cells[robot]
+            robot_shift = level.size + robot * level.cell_bits
+            for d in range(0, len(DIRECTIONS)):
+                new_cell = step[d][cell]
+                if new_cell < 0 or new_cell in robot_cells:
+                    continue
+
+                if box_bits >> new_cell & 1:
+                    new_box_cell = step[d][new_cell]
+                    if new_box_cell < 0 or new_box_cell in robot_cells or box_bits >> new_box_cell & 1:
+                        continue
+                    if dead_bits >> new_box_cell & 1:
+                        continue
+                    if robot < last_robot and not new_cell in last_cells and not new_box_cell in last_cells:
+                        StateSpace.suppressed = StateSpace.suppressed + 1
+                        continue
+                    new_boxes = set(boxes)
+                    new_boxes.remove(locations[new_cell])
+                    new_boxes.add(locations[new_box_cell])
+                    new_boxes = frozenset(new_boxes)
+                    new_key = (key + ((new_cell - cell) << robot_shift)) ^ (1 << new_cell) ^ (1 << new_box_cell)
+                    new_delta = (robot, cell, new_cell, new_box_cell)
+                else:
+                    if robot < last_robot and not new_cell in last_cells:
+                        StateSpace.suppressed = StateSpace.suppressed + 1
+                        continue
+                    new_boxes = boxes
+                    new_key = key + ((new_cell - cell) << robot_shift)
+                    new_delta = (robot, cell, -1, -1)
+
+                new_robots = robots[:robot] + (locations[new_cell],) + robots[robot + 1:]
+                yield self.child(str(robot) + " " + DIRECTIONS[d].name, gval, new_robots, new_boxes, new_key, new_delta)
+
+    def predecessors(self):
+        '''
+        Generates the states from which one action leads to this state (for bidirectional search).
+        These are the "pull" moves: a robot steps back against the direction of its move and,
+        if that move could have been a push, optionally drags the pushed box back along with it.
+        '''
+        predecessors = []
         transition_cost = 1
-        moved_boxes = frozenset()
+        level = self.level
+        width, height = level.width, level.height
+        obstacles = level.obstacles
 
         for robot in range(0, len(self.robots)):
+          location = self.robots[robot]
           for direction in (UP, RIGHT, DOWN, LEFT):
-              new_location = direction.move(self.robots[robot])
-              new_robots = list(self.robots);
-              new_robots.remove(self.robots[robot])
-              new_robots = tuple(new_robots)
-              new_boxes = set(self.boxes)
-              new_moved_boxes = set(moved_boxes)
-              
-              if new_location[0] < 0 or new_location[0] >= self.width:
+              old_location = (location[0] - direction.delta[0], location[1] - direction.delta[1])
+
+              if old_location[0] < 0 or old_location[0] >= width:
                   continue
-              if new_location[1] < 0 or new_location[1] >= self.height:
+              if old_location[1] < 0 or old_location[1] >= height:
                   continue
-              if new_location in self.obstacles:
+              if old_location in obstacles:
                   continue
-              if new_location in new_robots:
+              if old_location in self.robots:
                   continue
-              if new_location in moved_boxes:
+              if old_location in self.boxes:
                   continue
-              
-              if new_location in self.boxes:
-                  new_box_location = direction.move(new_location)
-                  
-                  if new_box_location[0] < 0 or new_box_location[0] >= self.width:
-                      continue
-                  if new_box_location[1] < 0 or new_box_location[1] >= self.height:
-                      continue
-                  if new_box_location in self.obstacles:
-                      continue
-                  if new_box_location in new_robots:
-                      continue
-                  if new_box_location in new_boxes:
+
+              action = str(robot) + " " + direction.name
+              new_robots = self.robots[:robot] + (old_location,) + self.robots[robot + 1:]
+              predecessors.append(self.child(action, self.gval + transition_cost, new_robots, self.boxes))
+
+              #a box ahead of the robot may have been pushed there by this move
+              box_location = direction.move(location)
+              if box_location in self.boxes:
+                  if self.prune_dead_pushes and box_location in level.dead_squares:
                       continue
-                  
-                  new_boxes.remove(new_location)
-                  new_boxes.add(new_box_location)
-                  new_moved_boxes.add(new_box_location)
-              
-              new_robots = list(self.robots)
-              new_robots[robot] = new_location
-              new_robots = tuple(new_robots)
-
-              new_state = SokobanState(str(robot) + " " + direction.name, self.gval + transition_cost, self, self.width, self.height, new_robots, frozenset(new_boxes), self.storage, self.obstacles)
-              successors.append(new_state)
+                  new_boxes = self.boxes.difference((box_location,)).union((location,))
+                  predecessors.append(self.child(action, self.gval + transition_cost, new_robots, new_boxes))
 
-        return successors
+        return predecessors
+
+    def goal_states(self):
+        '''
+        Generates the goal states of this state's level that a plan can end in (for bidirectional
+        search): the boxes fill a subset of the storage points and the robots stand on other free
+        cells, one of them next to a box with a free cell on its other side. The last move of an
+        optimal plan that starts off the goal is a push (had it been a walk, the plan would have
+        reached the goal a move earlier), which leaves the pushing robot just like that. There are
+        still up to C(storage, boxes) * P(free cells, robots) states, so this is only practical for
+        small rooms or few robots.
+        '''
+        level = self.level
+        free = [level.location(cell) for cell in level.walkable]
+        for boxes in combinations(sorted(self.storage), len(self.boxes)):
+            boxes = frozenset(boxes)
+            cells = [location for location in free if location not in boxes]
+            #for each cell a robot could have pushed a box from, where it stood before that push
+            behind = dict()
+            for location in cells:
+                for direction in (UP, RIGHT, DOWN, LEFT):
+                    old_location = (location[0] - direction.delta[0], location[1] - direction.delta[1])
+                    if direction.move(location) in boxes and old_location in cells:
+                        behind.setdefault(location, []).append(old_location)
+            for robots in permutations(cells, len(self.robots)):
+                if any(not old_location in robots for robot in robots for old_location in behind.get(robot, ())):
+                    yield SokobanState("GOAL", 0, None, self.width, self.height, robots, boxes,
+                                       self.storage, self.obstacles)
 
     def hashable_state(self):
-        '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state.'''
-        return hash((self.robots, self.boxes))       
+        '''
+        Return a data item that can be used as a dictionary key to UNIQUELY represent a state.
+        This is the level's int encoding of the robots and boxes (see SokobanLevel.encode), so
+        distinct states never share a key and decode_state() can rebuild the state from it.
+        '''
+        if self.key is None:
+            level = self.level
+            self.key = level.encode(tuple(level.cell(robot) for robot in self.robots), level.pack(self.boxes))
+        return self.key
+
+    def decode_state(self, key, action="START", gval=0, parent=None):
+        '''
+        @return: The SokobanState of this state's level whose hashable_state() is key.
+        '''
+        level = self.level
+        robot_cells, box_bits = level.decode(key)
+        state = type(self)(action, gval, parent, self.width, self.height,
+                           tuple(level.location(cell) for cell in robot_cells), level.unpack(box_bits),
+                           self.storage, self.obstacles)
+        state.key = key
+        return state
 
     def state_string(self):
         '''Returns a string representation fo a state that can be printed to stdout.'''        
@@ -147,6 +322,494 @@ def sokoban_goal_state(state):
       return False
   return True
 
+class SokobanLevel:
+    '''
+    The static part of a Sokoban problem: the room's dimensions, the storage
+    points and the obstacles. These never change between the states of one
+    problem, so a single level object is shared by all of them (see get_level).
+
+    Cells of the room are numbered y*width + x, which lets a set of locations
+    be stored as an int bitboard (bit i set iff cell i is in the set).
+    '''
+
+    def __init__(self, width, height, storage, obstacles):
+        self.width = width
+        self.height = height
+        self.storage = storage
+        self.obstacles = obstacles
+
+    def cell(self, location):
+        '''@return: The cell index of an (x, y) location.'''
+        return location[1] * self.width + location[0]
+
+    def location(self, cell):
+        '''@return: The (x, y) location of a cell index.'''
+        return (cell % self.width, cell // self.width)
+
+    def pack(self, locations):
+        '''@return: The bitboard of a collection of (x, y) locations.'''
+        bits = 0
+        for location in locations:
+            bits |= 1 << (location[1] * self.width + location[0])
+        return bits
+
+    def unpack(self, bits):
+        '''@return: The frozenset of (x, y) locations set in a bitboard.'''
+        locations = []
+        while bits:
+            low = bits & -bits
+            locations.append(self.location(low.bit_length() - 1))
+            bits ^= low
+        return frozenset(locations)
+
+    @cached_property
+    def size(self):
+        return self.width * self.height
+
+    @cached_property
+    def locations(self):
+        '''locations[cell] is location(cell), built once so states can share the tuples.'''
+        return tuple(self.location(cell) for cell in range(self.size))
+
+    @cached_property
+    def storage_bits(self):
+        return self.pack(self.storage)
+
+    @cached_property
+    def obstacle_bits(self):
+        return self.pack(self.obstacles)
+
+    @cached_property
+    def step(self):
+        '''
+        step[d][cell] is the cell reached by moving from cell in DIRECTIONS[d],
+        or -1 if that move would leave the room or enter an obstacle.
+        '''
+        step = []
+        for direction in DIRECTIONS:
+            table = []
+            for cell in range(self.size):
+                x, y = direction.move(self.location(cell))
+                if 0 <= x < self.width and 0 <= y < self.height and (x, y) not in self.obstacles:
+                    table.append(y * self.width + x)
+                else:
+                    table.append(-1)
+            step.append(tuple(table))
+        return tuple(step)
+
+    @cached_property
+    def walkable(self):
+        '''Tuple of the cells that are not obstacles.'''
+        return tuple(cell for cell in range(self.size) if not self.obstacle_bits >> cell & 1)
+
+    @cached_property
+    def neighbors(self):
+        '''neighbors[cell] is the tuple of free cells one move away from cell.'''
+        return tuple(tuple(step[cell] for step in self.step if step[cell] >= 0) for cell in range(self.size))
+
+    @cached_property
+    def distances(self):
+        '''
+        distances[a][b] is the number of moves a robot needs to walk from cell a to
+        cell b around the obstacles (ignoring boxes and other robots), or inf if b
+        cannot be reached. Computed by one BFS per walkable cell.
+        '''
+        INF = float('inf')
+        neighbors = self.neighbors
+        distances = []
+        for source in range(self.size):
+            row = [INF] * self.size
+            if not self.obstacle_bits >> source & 1:
+                row[source] = 0
+                layer = [source]
+                d = 0
+                while layer:
+                    d += 1
+                    next_layer = []
+                    for cell in layer:
+                        for n in neighbors[cell]:
+                            if row[n] == INF:
+                                row[n] = d
+                                next_layer.append(n)
+                    layer = next_layer
+            distances.append(tuple(row))
+        return tuple(distances)
+
+    @cached_property
+    def live_bits(self):
+        '''
+        Bitboard of the cells from which a box, alone in the room, can still be
+        pushed onto some storage point. Computed by reverse-push reachability: a
+        box reaches storage cell t from p if it can be pushed from p into t, i.e.
+        p and the robot's cell behind p (in the same direction) are free.
+        '''
+        live = 0
+        frontier = []
+        for cell in range(self.size):
+            if self.storage_bits >> cell & 1 and not self.obstacle_bits >> cell & 1:
+                live |= 1 << cell
+                frontier.append(cell)
+        while frontier:
+            cell = frontier.pop()
+            for step in self.step:
+                box_cell = step[cell]
+                if box_cell < 0 or live >> box_cell & 1:
+                    continue
+                if step[box_cell] >= 0:
+                    live |= 1 << box_cell
+                    frontier.append(box_cell)
+        return live
+
+    @cached_property
+    def storage_cells(self):
+        '''Tuple of the storage points' cells (the column order of push_distances).'''
+        return tuple(sorted(self.cell(location) for location in self.storage))
+
+    @cached_property
+    def push_distances(self):
+        '''
+        push_distances[cell][i] is the least number of pushes that moves a box,
+        alone in the room, from cell onto storage_cells[i] (inf if it never can).
+        Obstacles are respected both for the box and for the robot pushing it.
+        Computed by one reverse-push BFS per storage point.
+        '''
+        INF = float('inf')
+        columns = []
+        for target in self.storage_cells:
+            column = [INF] * self.size
+            if not self.obstacle_bits >> target & 1:
+                column[target] = 0
+                layer = [target]
+                d = 0
+                while layer:
+                    d += 1
+                    next_layer = []
+                    for cell in layer:
+                        for step in self.step:
+                            box_cell = step[cell]
+                            if box_cell >= 0 and column[box_cell] == INF and step[box_cell] >= 0:
+                                column[box_cell] = d
+                                next_layer.append(box_cell)
+                    layer = next_layer
+            columns.append(column)
+        return tuple(tuple(column[cell] for column in columns) for cell in range(self.size))
+
+    @cached_property
+    def min_push_distance(self):
+        '''min_push_distance[cell] is the push distance from cell to the nearest storage point.'''
+        return tuple(min(row, default=float('inf')) for row in self.push_distances)
+
+    @cached_property
+    def min_manhattan_distance(self):
+        '''min_manhattan_distance[cell] is the manhattan distance from cell to the nearest storage point.'''
+        return tuple(min((abs(x - sx) + abs(y - sy) for sx, sy in self.storage), default=float('inf'))
+                     for x, y in map(self.location, range(self.size)))
+
+    @cached_property
+    def dead_bits(self):
+        '''Bitboard of the free cells a box can never be pushed out of onto storage.'''
+        return ((1 << self.size) - 1) & ~self.live_bits & ~self.obstacle_bits
+
+    @cached_property
+    def dead_squares(self):
+        '''The dead cells as a frozenset of (x, y) locations.'''
+        return self.unpack(self.dead_bits)
+
+    @cached_property
+    def cell_bits(self):
+        '''Number of bits used for one robot in an encoded state key.'''
+        return (self.size + 1).bit_length()
+
+    def encode(self, robot_cells, box_bits):
+        '''
+        @return: A single int that uniquely identifies the robots and boxes:
+        the box bitboard in the low bits, then each robot's cell + 1 in
+        cell_bits-wide fields (so a field of zero marks the end).
+        '''
+        key = box_bits
+        shift = self.size
+        for cell in robot_cells:
+            key |= (cell + 1) << shift
+            shift += self.cell_bits
+        return key
+
+    def decode(self, key):
+        '''@return: The (robot_cells, box_bits) pair encoded in key.'''
+        box_bits = key & ((1 << self.size) - 1)
+        key >>= self.size
+        mask = (1 << self.cell_bits) - 1
+        robot_cells = []
+        while key:
+            robot_cells.append((key & mask) - 1)
+            key >>= self.cell_bits
+        return tuple(robot_cells), box_bits
+
+
+_LEVELS = dict()
+
+def get_level(width, height, storage, obstacles):
+    '''@return: The shared SokobanLevel object for this static map data.'''
+    key = (width, height, storage, obstacles)
+    level = _LEVELS.get(key)
+    if level is None:
+        level = SokobanLevel(width, height, storage, obstacles)
+        _LEVELS[key] = level
+    return level
+
+
+class PackedSokobanState(StateSpace):
+    '''
+    A compact Sokoban state. Robots are a tuple of cell indices, boxes are an
+    int bitboard and all the static map data lives in the shared SokobanLevel,
+    so each state carries four slots on top of StateSpace's (the fourth, delta,
+    is the move that made it) and hashes as a single int. The robots, boxes, width, height, storage and obstacles
+    attributes of SokobanState are available (decoded on access), so goal
+    functions and heuristics written for SokobanState still work.
+    '''
+
+    __slots__ = ('level', 'robot_cells', 'box_bits', 'delta')
+
+    #See SokobanState.prune_dead_pushes and SokobanState.reduce_interleavings.
+    prune_dead_pushes = False
+    reduce_interleavings = False
+
+    def __init__(self, action, gval, parent, level, robot_cells, box_bits):
+        '''
+        Creates a new packed Sokoban state.
+        @param level: The SokobanLevel the state belongs to.
+        @param robot_cells: A tuple of the robots' cell indices.
+        @param box_bits: The bitboard of the boxes' cells.
+        '''
+        StateSpace.__init__(self, action, gval, parent)
+        self.level = level
+        self.robot_cells = robot_cells
+        self.box_bits = box_bits
+        #the move that generated this state from its parent (see SokobanState.child)
+        self.delta = None
+
+    @classmethod
+    def from_state(cls, state):
+        '''@return: The packed equivalent of a SokobanState (without its parent).'''
+        level = get_level(state.width, state.height, state.storage, state.obstacles)
+        return cls(state.action, state.gval, None, level,
+                   tuple(level.cell(robot) for robot in state.robots), level.pack(state.boxes))
+
+    def unpack(self):
+        '''@return: The SokobanState equivalent of this state (without its parent).'''
+        return SokobanState(self.action, self.gval, None, self.width, self.height,
+                            self.robots, self.boxes, self.storage, self.obstacles)
+
+    def successors(self):
+        '''
+        Generates all the actions that can be performed from this state, and the states those actions will create.
+        '''
+        successors = []
+        transition_cost = 1
+        level = self.level
+        robot_cells = self.robot_cells
+        box_bits = self.box_bits
+
+        #cells touched by the move that made this state (see SokobanState.reduce_interleavings)
+        last_robot = -1
+        if self.reduce_interleavings and self.delta is not None:
+            last_robot, last_cell, _, last_box = self.delta
+            last_cells = {last_cell, robot_cells[last_robot], last_box}
+            last_cells.discard(-1)
+
+        for robot in range(0, len(robot_cells)):
+            for d in range(0, len(DIRECTIONS)):
+                step = level.step[d]
+                new_cell = step[robot_cells[robot]]
+                if new_cell < 0 or new_cell in robot_cells:
+                    continue
+
+                new_box_bits = box_bits
+                new_delta = (robot, robot_cells[robot], -1, -1)
+                if box_bits >> new_cell & 1:
+                    new_box_cell = step[new_cell]
+                    if new_box_cell < 0 or new_box_cell in robot_cells or box_bits >> new_box_cell & 1:
+                        continue
+                    if self.prune_dead_pushes and level.dead_bits >> new_box_cell & 1:
+                        continue
+                    new_box_bits = box_bits ^ (1 << new_cell) | (1 << new_box_cell)
+                    new_delta = (robot, robot_cells[robot], new_cell, new_box_cell)
+
+                if robot < last_robot and not new_cell in last_cells and not new_delta[3] in last_cells:
+                    StateSpace.suppressed = StateSpace.suppressed + 1
+                    continue
+
+                new_robot_cells = robot_cells[:robot] + (new_cell,) + robot_cells[robot + 1:]
+                new_state = PackedSokobanState(str(robot) + " " + DIRECTIONS[d].name, self.gval + transition_cost,
+                                               self, level, new_robot_cells, new_box_bits)
+                new_state.delta = new_delta
+                successors.append(new_state)
+
+        return successors
+
+    def hashable_state(self):
+        '''Return a data item that can be used as a dictionary key to UNIQUELY represent a state.'''
+        return self.level.encode(self.robot_cells, self.box_bits)
+
+    def decode_state(self, key, action="START", gval=0, parent=None):
+        '''
+        @return: The PackedSokobanState of this state's level whose hashable_state() is key.
+        '''
+        robot_cells, box_bits = self.level.decode(key)
+        return PackedSokobanState(action, gval, parent, self.level, robot_cells, box_bits)
+
+    @property
+    def width(self): return self.level.width
+
+    @property
+    def height(self): return self.level.height
+
+    @property
+    def storage(self): return self.level.storage
+
+    @property
+    def obstacles(self): return self.level.obstacles
+
+    @property
+    def robots(self): return tuple(self.level.location(cell) for cell in self.robot_cells)
+
+    @property
+    def boxes(self): return self.level.unpack(self.box_bits)
+
+    state_string = SokobanState.state_string
+    print_state = SokobanState.print_state
+
+
+def packed_goal_state(state):
+  '''Returns True if we have reached a goal state (bitboard test for PackedSokobanState)'''
+  return not state.box_bits & ~state.level.storage_bits
+
+
+class MacroSokobanState(SokobanState):
+    '''
+    A Sokoban state whose successors are pushes. A flood fill finds every
+    cell the robot can walk to (around the boxes) and the number of moves
+    that takes; each box it can then push gives one successor, with the
+    robot on the box's old cell and a cost of the walk length + 1. The
+    action lists the robot's moves, e.g. "0 up up left". Costs are those of
+    the single move plan, so A* with an admissible heuristic stays optimal.
+
+    Only levels with one robot are supported. With several, a robot would
+    only move to push, so plans in which a robot steps out of another's way
+    (and their costs) would be lost; the constructor raises ValueError.
+
+    The robots, boxes and level are those of SokobanState, so goal functions
+    and heuristics written for it work unchanged. There are no predecessors
+    (bidirectional search is not supported), and reduce_interleavings does
+    not apply: a push already stands for the whole walk before it.
+    '''
+
+    __slots__ = ()
+
+    #When True, hashable_state() stands the robot on the first cell (in cell
+    #order) of the region it can reach, so states that differ only by where
+    #the robot is within its region share a key. They are the same as far as
+    #pushes go, and the state space shrinks by far more, but the walk to the
+    #next push is not, so cycle checking may then keep a costlier one and
+    #solutions are no longer guaranteed optimal. decode_state() gives the
+    #state with the robot on that cell.
+    normalize_robots = False
+
+    def __init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles):
+        '''Creates a new macro Sokoban state (see SokobanState); robots must hold one robot.'''
+        if len(robots) != 1:
+            raise ValueError("MacroSokobanState only supports levels with one robot, not {}.".format(len(robots)))
+        SokobanState.__init__(self, action, gval, parent, width, height, robots, boxes, storage, obstacles)
+
+    @classmethod
+    def from_state(cls, state):
+        '''@return: The macro equivalent of a SokobanState (without its parent).'''
+        return cls(state.action, state.gval, None, state.width, state.height,
+                   state.robots, state.boxes, state.storage, state.obstacles)
+
+    def _flood(self, robot, robot_cells, box_bits):
+        '''
+        Breadth first walk of one robot, with the boxes in the way.
+        @return: The cells reached, in order of distance, and a dict that maps each of
+        them to the (previous cell, direction index) it was first reached by.
+        '''
+        step = self.level.step
+        start = robot_cells[robot]
+        blocked = box_bits
+        for cell in robot_cells:
+            blocked |= 1 << cell
+        reached = [start]
+        came_from = {start: None}
+        for cell in reached:
+            for d in range(0, len(DIRECTIONS)):
+                new_cell = step[d][cell]
+                if new_cell < 0 or new_cell in came_from or blocked >> new_cell & 1:
+                    continue
+                came_from[new_cell] = (cell, d)
+                reached.append(new_cell)
+        return reached, came_from
+
+    def successors(self):
+        '''
+        Generates all the pushes that can be performed from this state, and the states those pushes will create.
+        '''
+        successors = []
+        level = self.level
+        step = level.step
+        robot_cells = tuple(level.cell(robot) for robot in self.robots)
+        box_bits = level.pack(self.boxes)
+        blocked = box_bits
+        for cell in robot_cells:
+            blocked |= 1 << cell
+
+        for robot in range(0, len(robot_cells)):
+            reached, came_from = self._flood(robot, robot_cells, box_bits)
+            #the robot's own cell is free once it has walked off
+            others = blocked & ~(1 << robot_cells[robot])
+            for cell in reached:
+                for d in range(0, len(DIRECTIONS)):
+                    box_cell = step[d][cell]
+                    if box_cell < 0 or not box_bits >> box_cell & 1:
+                        continue
+                    new_box_cell = step[d][box_cell]
+                    if new_box_cell < 0 or others >> new_box_cell & 1:
+                        continue
+                    if self.prune_dead_pushes and level.dead_bits >> new_box_cell & 1:
+                        continue
+
+                    moves = [DIRECTIONS[d].name]
+                    walk = came_from[cell]
+                    while walk is not None:
+                        moves.append(DIRECTIONS[walk[1]].name)
+                        walk = came_from[walk[0]]
+                    moves.reverse()
+
+                    new_robots = list(self.robots)
+                    new_robots[robot] = level.location(box_cell)
+                    new_boxes = level.unpack(box_bits ^ (1 << box_cell) | (1 << new_box_cell))
+                    new_state = self.child(str(robot) + " " + " ".join(moves), self.gval + len(moves),
+                                           tuple(new_robots), new_boxes, None,
+                                           (robot, robot_cells[robot], box_cell, new_box_cell))
+                    successors.append(new_state)
+
+        return successors
+
+    def hashable_state(self):
+        '''
+        The key of SokobanState, or with normalize_robots the key of the state with the
+        robot moved to the first cell of its region.
+        '''
+        if self.key is None:
+            level = self.level
+            robot_cells = tuple(level.cell(robot) for robot in self.robots)
+            if self.normalize_robots:
+                robot_cells = (min(self._flood(0, robot_cells, level.pack(self.boxes))[0]),)
+            self.key = level.encode(robot_cells, level.pack(self.boxes))
+        return self.key
+
+    iter_successors = StateSpace.iter_successors
+    predecessors = StateSpace.predecessors
+    goal_states = StateSpace.goal_states
+
 '''
 Sokoban Problem Set, for testing
 '''
@@ -320,6 +983,7 @@ UP = Direction("up", (0, -1))
 RIGHT = Direction("right", (1, 0))
 DOWN = Direction("down", (0, 1))
 LEFT = Direction("left", (-1, 0))
+DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
 
 
 
@@ -7,6 +7,7 @@
 #   You may not import or otherwise source any of your own files
 
 import os
+import copy
 
 from scipy.optimize.optimize import wrap_function #for time functions
 from search import * #for search engines
@@ -14,6 +15,10 @@ from sokoban import SokobanState, Direction, PROBLEMS #for Sokoban specific clas
 import math
 import csv
 import numpy as np
+from collections import OrderedDict
+from functools import partial
+import multiprocessing
+from queue import Empty
 # from scipy.optimize import linear_sum_assignment
 
 def sokoban_goal_state(state):
@@ -52,6 +57,23 @@ def heur_manhattan_distance(state):
     return manhattan_dist
 
 
+def _incremental_box_sum(table_name):
+    '''Incremental form of a heuristic that sums a per-cell level table over the boxes:
+       h(child) = h(parent) - table[old box cell] + table[new box cell], using the move
+       delta recorded by successors() (robot moves leave h unchanged)'''
+    def incremental(parent, parent_hval, state):
+      delta = getattr(state, 'delta', None)
+      if delta is None or parent_hval == float('inf'):
+        return None
+      _, _, old_cell, new_cell = delta
+      if old_cell < 0:
+        return parent_hval
+      table = getattr(state.level, table_name)
+      return parent_hval - table[old_cell] + table[new_cell]
+    return incremental
+
+heur_manhattan_distance.incremental = _incremental_box_sum('min_manhattan_distance')
+
 #SOKOBAN HEURISTICS
 def trivial_heuristic(state):
   '''trivial admissible sokoban heuristic'''
@@ -76,32 +98,33 @@ def heur_alternate(state):
     INF = float('inf')
 
     # convert all the items in the state to a list for easier use 
-    boxes = list(state.boxes)
+    # (the boxes are assigned storage greedily, so take them in a fixed order, row by row
+    # as their cells are numbered, for equal states to get equal values however their
+    # box sets were built)
+    boxes = sorted(state.boxes, key=lambda box: (box[1], box[0]))
     storages = list(state.storage)
     obstacles = list(state.obstacles)
 
     # Get a set of all boxes and obstacles to check for corners with boxes and obstacles 
-    box_and_obs = boxes + obstacles
-    #box_and_obs = list(box_and_obs)
+    # (a box's neighbours are never the box itself, so it can stay in the set)
+    box_and_obs = set(boxes)
+    box_and_obs.update(obstacles)
 
-    # Need this to help pass certain cases where we need to check if certain storage coordinates are blocked
-    storage_x = []
-    storage_y = []
-
-    # NEED SEPERATE COORDINATES FOR EDGES 
-    for storage in storages:
-      x, y = storage
-      storage_x.append(x)
-      storage_y.append(y)
+    # Squares a box can never be pushed out of onto storage (walls without storage, corners, ...)
+    # These only depend on the map, so they are precomputed once per level
+    dead_squares = state.level.dead_squares
 
     # NEED TO KEEP TRACK OF ALL THE USED STORAGE SPACES SO WE DON'T USE IT AGAIN
-    used_storage = []
+    used_storage = set()
     
     for box in boxes:
-      box_and_obs.remove(box)
       box_to_goal_dist = {}
       rob_to_box_dist = []
 
+      # CHECK IF BOX IS ON A DEAD SQUARE (E.G. AT AN EDGE WITHOUT A STORAGE SPOT)
+      if box in dead_squares:
+        return INF
+
       # DEFINE THE WALL COORDINATES
       left_wall = box[0] == 0
       right_wall = box[0] == state.width - 1
@@ -109,16 +132,6 @@ def heur_alternate(state):
       bottom_wall = box[1] == state.height - 1
 
 
-      # CHECK IF BOX AT EDGE AND A STORAGE SPOT ISNT AT AN EDGE
-      if(left_wall and (0 not in storage_x)):
-        return INF
-      elif(right_wall and(state.width - 1 not in storage_x)):
-        return INF
-      elif(top_wall and (0 not in storage_y)):
-        return INF
-      elif(bottom_wall and (state.height - 1 not in storage_y)):
-        return INF
-
       # DEFINE THE OBSTACLES/BOXES IN THE X DIRECTIONS AND Y DIRECTIONS
       x_dir = (box[0] - 1, box[1]) in box_and_obs or (box[0] + 1, box[1]) in box_and_obs
       y_dir = (box[0], box[1] - 1) in box_and_obs or (box[0], box[1] + 1) in box_and_obs
@@ -128,7 +141,7 @@ def heur_alternate(state):
       y_items = top_wall or bottom_wall or y_dir
 
       #CHECK CORNERS TO CHECK IF WE HAVE CORNERS WITH BOXES/OBSTACLES/WALLS
-      if(x_items and y_items and box not in storages):
+      if(x_items and y_items and box not in state.storage):
         return INF
       
       # GET DISTANCES FROM STORAGE SPOTS TO BOXES AND ENSURE STORAGE NOT TAKEN
@@ -138,7 +151,7 @@ def heur_alternate(state):
       
       # GET THE SHORTEST DISTANCE STORAGE LOCATION FROM THE CURRENT BOX AND THEN ADD TO TAKEN STORAGE LOCATIONS
       closest_key = min(box_to_goal_dist, key=box_to_goal_dist.get)
-      used_storage.append(closest_key)
+      used_storage.add(closest_key)
 
       # GET DISTANCES FROM THE ROBOTS TO THE BOX TO TAKE THE DISTANCE TRAVELLED FROM ROBOT TO BOX BEFORE PUSHING
       for robot in state.robots:
@@ -147,11 +160,144 @@ def heur_alternate(state):
       
       # added smallest distances to the min distance between either the robot to box distance or the box to goal distance and then multiply by 0.6 it to ensure admisabllity
       total_manhattan += (box_to_goal_dist[closest_key] + min(box_to_goal_dist[closest_key], rob_to_box_dist[0])*0.6)
-      
-      box_and_obs.append(box)
   
     return total_manhattan
         
+def heur_push_distance(state):
+    '''admissible sokoban heuristic: true box push distances'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+    # Like the manhattan distance, but each box is charged the least number of pushes that would
+    # get it onto its nearest storage point around the obstacles. The table is precomputed once
+    # per level, so each box costs one lookup. Boxes that can never be stored give inf.
+    level = state.level
+    width = level.width
+    min_push_distance = level.min_push_distance
+
+    total = 0
+    for box in state.boxes:
+      total += min_push_distance[box[1] * width + box[0]]
+    return total
+
+heur_push_distance.incremental = _incremental_box_sum('min_push_distance')
+
+# Finite stand-in for an impossible (inf) box to storage distance inside the assignment
+_NO_PATH = 10**6
+# Number of box configurations whose optimal assignment is kept for incremental repair
+_MATCHING_CACHE_SIZE = 20000
+_matching_cache = OrderedDict()
+
+def _augment_row(cost, u, v, p, i):
+    '''Hungarian method step: assign row i (1-based) by a shortest augmenting path,
+       keeping the duals u, v feasible and tight on the assignment p (p[j] = row of column j)'''
+    m = len(v) - 1
+    INF = float('inf')
+    minv = [INF] * (m + 1)
+    used = [False] * (m + 1)
+    way = [0] * (m + 1)
+    p[0] = i
+    j0 = 0
+    while True:
+      used[j0] = True
+      i0 = p[j0]
+      row = cost[i0]
+      ui0 = u[i0]
+      delta = INF
+      j1 = 0
+      for j in range(1, m + 1):
+        if not used[j]:
+          cur = row[j - 1] - ui0 - v[j]
+          if cur < minv[j]:
+            minv[j] = cur
+            way[j] = j0
+          if minv[j] < delta:
+            delta = minv[j]
+            j1 = j
+      for j in range(0, m + 1):
+        if used[j]:
+          u[p[j]] += delta
+          v[j] -= delta
+        else:
+          minv[j] -= delta
+      j0 = j1
+      if p[j0] == 0:
+        break
+    while j0:
+      j1 = way[j0]
+      p[j0] = p[j1]
+      j0 = j1
+
+def heur_matching(state):
+    '''admissible sokoban heuristic: minimum cost box to storage assignment'''
+    '''INPUT: a sokoban state'''
+    '''OUTPUT: a numeric value that serves as an estimate of the distance of the state to the goal.'''
+    # Every box needs its own storage point, so the cheapest one-to-one assignment of boxes to
+    # storage under the push distances (see heur_push_distance) is a lower bound on the pushes left.
+    # It is found with the Hungarian method on a square matrix (extra zero-cost rows stand for the
+    # storage points left empty). Optimal assignments are cached by box configuration, and a state
+    # pushed from a cached one (found through the push recorded in state.delta, so the parent
+    # itself isn't needed) reuses it: a push only replaces one row, which is repaired with a
+    # single augmenting path instead of a full solve. Robot moves keep the box configuration.
+    level = state.level
+    width = level.width
+    push_distances = level.push_distances
+
+    if len(state.boxes) > len(level.storage_cells):
+      # some box can never be stored
+      return float('inf')
+
+    entry = _matching_cache.get((level, state.boxes))
+    if entry is not None:
+      _matching_cache.move_to_end((level, state.boxes))
+      return entry[0]
+
+    delta = getattr(state, 'delta', None)
+    parent_entry = None
+    if delta is not None and delta[2] >= 0:
+      old_box = level.locations[delta[2]]
+      new_box = level.locations[delta[3]]
+      parent_entry = _matching_cache.get((level, state.boxes - {new_box} | {old_box}))
+
+    if parent_entry is not None:
+      # repair the parent's assignment: only the pushed box's row changed
+      _, boxes, cost, u, v, p = parent_entry
+      i = boxes.index(old_box) + 1
+      boxes = list(boxes)
+      boxes[i - 1] = new_box
+      cost = list(cost)
+      cost[i] = [_NO_PATH if d == float('inf') else d for d in push_distances[new_box[1] * width + new_box[0]]]
+      u, v, p = list(u), list(v), list(p)
+      p[p.index(i, 1)] = 0
+      u[i] = min(cost[i][j - 1] - v[j] for j in range(1, len(v)))
+      _augment_row(cost, u, v, p, i)
+    else:
+      boxes = list(state.boxes)
+      m = len(level.storage_cells)
+      cost = [None]
+      for box in boxes:
+        cost.append([_NO_PATH if d == float('inf') else d for d in push_distances[box[1] * width + box[0]]])
+      for _ in range(len(boxes), m):
+        cost.append([0] * m)
+      u = [0] * (len(cost))
+      v = [0] * (m + 1)
+      p = [0] * (m + 1)
+      for i in range(1, len(cost)):
+        _augment_row(cost, u, v, p, i)
+
+    total = 0
+    for j in range(1, len(p)):
+      total += cost[p[j]][j - 1]
+    if total >= _NO_PATH:
+      total = float('inf')
+
+    _matching_cache[(level, state.boxes)] = (total, boxes, cost, u, v, p)
+    if len(_matching_cache) > _MATCHING_CACHE_SIZE:
+      _matching_cache.popitem(last=False)
+    return total
+
+# the cached assignments belong to the levels searched so far, not to the next search
+heur_matching.reset = _matching_cache.clear
+
 def heur_zero(state):
     '''Zero Heuristic can be used to make A* search perform uniform cost search'''
     return 0
@@ -283,10 +429,6 @@ def anytime_weighted_astar(initial_state, heur_fn, weight=1., timebound = 10):
   '''OUTPUT: A goal state (if a goal is found), else False'''
   '''implementation of weighted astar algorithm'''
 
-    # Define constant INF
-  INF = float("inf")
-  # Initalize costbound to be at INFINITY and best solution
-  costbound = (INF, INF, INF)
   best_solution = False 
   # 15 with weight 6 and fval funct
   weight = 6
@@ -298,22 +440,10 @@ def anytime_weighted_astar(initial_state, heur_fn, weight=1., timebound = 10):
   # Run the search 
   search_eng.init_search(initState=initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=wrapper_func)
 
-  # Get the start time and completion time
-  start_time = os.times()[0]
-  completion_time = start_time + timebound
-
-  # Keep searching before the timebound 
-  while (os.times()[0] < completion_time):
-    # Get the new timebound to update it
-    # start_time = os.times()[0]
-    new_solution, _ = search_eng.search(completion_time - os.times()[0], costbound)
-    # time_taken = os.times()[0] - start_time
-    # timebound -= time_taken
-    if(new_solution):
-      costbound = (new_solution.gval, INF, INF)
-      best_solution = new_solution
-    else:
-      break 
+  # Keep the last (cheapest) of the solutions found before the timebound; after each one
+  # the engine prunes its frontier of paths that cost at least as much
+  for best_solution, _ in search_eng.iter_solutions(timebound):
+    pass
   return best_solution
 
 def anytime_gbfs(initial_state, heur_fn, timebound = 10):
@@ -324,11 +454,6 @@ def anytime_gbfs(initial_state, heur_fn, timebound = 10):
   '''implementation of anytime greedy best-first search'''
   # TO PRUNE STATES BASED ON costbound[0] FOR GREEDY BEST FIRST SEARCH 
 
-  # Define constant INF
-  INF = float("inf")
-
-  # Initalize costbound to be at INFINITY and best solution
-  costbound = (INF, INF, INF)
   best_solution = False 
 
   # Call on the SearchEngine Class 
@@ -336,27 +461,133 @@ def anytime_gbfs(initial_state, heur_fn, timebound = 10):
   # Run the search 
   search_eng.init_search(initState=initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=None)
 
-  # Get the start time and completion time
-  start_time = os.times()[0]
-  completion_time = start_time + timebound
-
-  # Get the goal state of the first solution 
-  #solution, _ = search_eng.search(timebound)
-
-  # Keep searching before the timebound 
-  while (start_time <= completion_time):
-  #while(timebound > 0):
-    #if(solution):
-    # Get the new timebound to update it
-    start_time = os.times()[0]
-    #completion_time = start_time + timebound
-    new_solution, _ = search_eng.search(timebound, costbound)
-    time_taken = os.times()[0] - start_time
-    timebound -= time_taken
-    if(new_solution):
-      costbound = (new_solution.gval, INF, INF)
-      best_solution = new_solution
-    else:
-      break 
+  # Keep the last (cheapest) of the solutions found before the timebound; after each one
+  # the engine prunes its frontier of paths that cost at least as much
+  for best_solution, _ in search_eng.iter_solutions(timebound):
+    pass
   return best_solution
 
+class _SharedCostbound:
+  '''A costbound 3-tuple for SearchEngine.search whose g bound lies just below the best
+     solution cost found so far by any portfolio worker (a shared multiprocessing.Value),
+     so that, as in SearchEngine.iter_solutions, paths costing as much are pruned too. It
+     is read without taking the value's lock: one double is read whole, and a stale read
+     only delays pruning until the next one.'''
+  def __init__(self, best_cost):
+    self.best_cost = best_cost.get_obj()
+
+  def __getitem__(self, i):
+    if i == 0:
+      return math.nextafter(self.best_cost.value, -float("inf"))
+    return float("inf")
+
+# Set in each portfolio worker process by _portfolio_init
+_portfolio_best_cost = None
+_portfolio_solutions = None
+
+def _portfolio_init(best_cost, solutions):
+  global _portfolio_best_cost, _portfolio_solutions
+  _portfolio_best_cost = best_cost
+  _portfolio_solutions = solutions
+
+def _flatten_path(state):
+  '''@return: The path to state as a list of copies of its states with the parent links
+     cut, so that pickling it doesn't recurse down the path. The states themselves keep
+     their links: later solutions may share the path's prefix.'''
+  path = []
+  while state:
+    path.append(copy.copy(state))
+    state = state.parent
+  path.reverse()
+  for state in path:
+    state.parent = None
+  return path
+
+def _portfolio_worker(initial_state, strategy, heur_fn, fval_fn, completion_time):
+  '''Runs one portfolio configuration as an anytime search until completion_time (in
+     os.times() elapsed real time), publishing every improvement to the shared best cost
+     and, as a flattened path, to the solutions queue. Returns its best path, or None.'''
+  costbound = _SharedCostbound(_portfolio_best_cost)
+  # the deadline is wall clock time, and the workers share the CPUs
+  search_eng = SearchEngine(strategy, 'full')
+  search_eng.set_clock('wall')
+  search_eng.init_search(initState=initial_state, goal_fn=sokoban_goal_state, heur_fn=heur_fn, fval_function=fval_fn)
+
+  best_path = None
+  while os.times()[4] < completion_time:
+    new_solution, _ = search_eng.search(completion_time - os.times()[4], costbound)
+    if not new_solution:
+      break
+    with _portfolio_best_cost.get_lock():
+      improved = new_solution.gval < _portfolio_best_cost.value
+      if improved:
+        _portfolio_best_cost.value = new_solution.gval
+    if improved:
+      best_path = _flatten_path(new_solution)
+      _portfolio_solutions.put(best_path)
+    # as iter_solutions does, drop what can no longer beat the best cost before resuming
+    search_eng.tighten_costbound(costbound)
+  return best_path
+
+# Seconds the portfolio waits for its workers past the deadline
+_PORTFOLIO_GRACE = 0.2
+
+# Default portfolio: (strategy, heuristic, fval function) for each worker
+PORTFOLIO = (
+  ('best_first', heur_alternate, None),
+  ('custom', heur_alternate, partial(fval_function, weight=6)),
+  ('custom', heur_alternate, partial(fval_function_XUP, weight=4)),
+  ('custom', heur_alternate, partial(fval_function_XDP, weight=4)),
+  ('custom', heur_matching, partial(fval_function, weight=2)),
+  ('astar', heur_push_distance, None),
+)
+
+def anytime_portfolio(initial_state, configs=PORTFOLIO, timebound = 10, processes=None):
+  '''Runs several anytime search configurations in parallel, each in its own process'''
+  '''INPUT: a sokoban state that represents the start state, a sequence of (strategy,
+     heuristic, fval function) configurations, a timebound (number of seconds) and the
+     number of worker processes (default: one per configuration)'''
+  '''OUTPUT: The cheapest goal state found by any configuration (if a goal is found), else False'''
+  # Every worker prunes against the cheapest solution found so far by any of them, like
+  # anytime_weighted_astar does with its own solutions. All workers stop at the same
+  # (wall clock) deadline; with fewer processes than configurations the queued ones only
+  # get what is left of it. The heuristics and fval functions must be picklable, so use
+  # module level functions (and functools.partial to fix a weight).
+  INF = float("inf")
+  if processes is None:
+    processes = len(configs)
+
+  best_cost = multiprocessing.Value('d', INF)
+  solutions = multiprocessing.Queue()
+  completion_time = os.times()[4] + timebound
+  best_path = None
+
+  pool = multiprocessing.Pool(processes, _portfolio_init, (best_cost, solutions))
+  try:
+    results = pool.starmap_async(_portfolio_worker, [(initial_state, strategy, heur_fn, fval_fn, completion_time)
+                                                     for strategy, heur_fn, fval_fn in configs])
+    pool.close()
+    # the workers stop at the deadline themselves, so give them a moment to return
+    results.wait(max(0, completion_time - os.times()[4]) + _PORTFOLIO_GRACE)
+    if results.ready():
+      paths = results.get()
+    else:
+      # some worker is still running: collect what was published, allowing for a put
+      # that hasn't reached the queue yet
+      paths = []
+      while True:
+        try:
+          paths.append(solutions.get(timeout=_PORTFOLIO_GRACE))
+        except Empty:
+          break
+    for path in paths:
+      if path and (best_path is None or path[-1].gval < best_path[-1].gval):
+        best_path = path
+  finally:
+    pool.terminate()
+
+  if best_path is None:
+    return False
+  for parent, state in zip(best_path, best_path[1:]):
+    state.parent = parent
+  return best_path[-1]
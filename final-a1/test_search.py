@@ -0,0 +1,232 @@
+'''Behaviour tests for the search engine options. Run with pytest from this directory.'''
+
+import random
+import time
+
+import pytest
+
+from search import SearchEngine, SpillingClosedList, sNode, _hda_owner
+from sokoban import SokobanState, sokoban_goal_state, PROBLEMS
+from solution import heur_manhattan_distance, heur_matching, heur_push_distance, heur_zero
+
+
+def solve(index, strategy='astar', heur_fn=heur_manhattan_distance, timebound=30, memory_bound=None,
+          frontier='lazy', **options):
+    se = SearchEngine(strategy, 'full', frontier=frontier)
+    se.init_search(PROBLEMS[index], sokoban_goal_state, heur_fn, **options)
+    final, stats = se.search(timebound, memory_bound=memory_bound)
+    return se, final
+
+
+def assert_replays(start, final):
+    '''final's path leads from start to a goal, each step a successor of the one before.'''
+    path = []
+    state = final
+    while state is not None:
+        path.append(state)
+        state = state.parent
+    path.reverse()
+    assert path[0].hashable_state() == start.hashable_state()
+    for state, succ in zip(path, path[1:]):
+        moves = {(s.hashable_state(), s.action): s.gval - state.gval for s in state.successors()}
+        assert moves.get((succ.hashable_state(), succ.action)) == succ.gval - state.gval
+    assert sokoban_goal_state(final)
+
+
+@pytest.mark.parametrize('strategy, index', [
+    ('ucs', 0), ('ucs', 1), ('ucs', 7), ('astar', 0), ('astar', 1), ('astar', 2), ('astar', 3), ('astar', 7)])
+def test_indexed_frontier_finds_the_same_cost(strategy, index):
+    _, lazy = solve(index, strategy)
+    _, indexed = solve(index, strategy, frontier='indexed')
+    assert indexed.gval == lazy.gval
+    assert_replays(PROBLEMS[index], indexed)
+
+
+@pytest.mark.parametrize('strategy, index, memory_bound, lazy_heuristic', [
+    ('astar', 0, 30000, False), ('astar', 0, 30000, heur_zero), ('astar', 3, 200000, False), ('astar', 7, 250000, False),
+    ('ucs', 0, 60000, False), ('ucs', 3, 700000, False), ('ucs', 7, 230000, False)])
+@pytest.mark.parametrize('frontier', ['lazy', 'indexed'])
+def test_memory_bound_keeps_optimal_cost(strategy, index, memory_bound, lazy_heuristic, frontier):
+    _, unbounded = solve(index, strategy)
+    se, final = solve(index, strategy, memory_bound=memory_bound, frontier=frontier, lazy_heuristic=lazy_heuristic)
+    assert se.states_forgotten > 0
+    assert final.gval == unbounded.gval
+
+
+@pytest.mark.parametrize('index', [0, 1, 3])
+def test_idastar_finds_the_astar_cost(index):
+    _, optimal = solve(index)
+    se = SearchEngine('idastar')
+    se.init_search(PROBLEMS[index], sokoban_goal_state, heur_manhattan_distance)
+    final, stats = se.search(30)
+    assert final.gval == optimal.gval
+    assert_replays(PROBLEMS[index], final)
+
+
+@pytest.mark.parametrize('index', [1, 3])
+def test_iter_solutions_costs_strictly_decrease(index):
+    _, optimal = solve(index)
+    se = SearchEngine('best_first', 'full')
+    se.init_search(PROBLEMS[index], sokoban_goal_state, heur_manhattan_distance)
+    costs = [goal.gval for goal, stats in se.iter_solutions(30)]
+    assert len(costs) > 1
+    assert all(cost > cheaper for cost, cheaper in zip(costs, costs[1:]))
+    #the search ran out of cheaper paths, so the last one is optimal
+    assert costs[-1] == optimal.gval
+
+
+def test_hooks_see_every_event():
+    INF = float('inf')
+    expanded, generated, pruned = [], [], []
+    se = SearchEngine('astar', 'full')
+    se.set_hooks(expanded.append, generated.append, lambda state, reason: pruned.append((state, reason)))
+    se.init_search(PROBLEMS[3], sokoban_goal_state, heur_manhattan_distance)
+    #an f bound at the optimal cost, so that some successors are over it
+    final, stats = se.search(30, (INF, INF, 8))
+    assert final.gval == 8
+    assert expanded and all(isinstance(node, sNode) for node in expanded)
+    expanded_states = {id(node.state) for node in expanded}
+    for node in generated:
+        assert isinstance(node, sNode)
+        assert id(node.state.parent) in expanded_states
+        assert node.gval == node.state.gval
+    reasons = [reason for state, reason in pruned]
+    assert all(isinstance(state, SokobanState) for state, reason in pruned)
+    assert reasons.count('cycle') == stats.states_pruned_cycles > 0
+    assert reasons.count('cost') == stats.states_pruned_cost > 0
+    assert reasons.count('stale') == stats.stale_pops
+
+    se.set_hooks()
+    se.init_search(PROBLEMS[3], sokoban_goal_state, heur_manhattan_distance)
+    calls = len(expanded) + len(generated) + len(pruned)
+    se.search(30)
+    assert len(expanded) + len(generated) + len(pruned) == calls
+
+
+@pytest.mark.parametrize('index', [0, 1, 3, 7])
+def test_lazy_heuristic_finds_the_eager_cost(index):
+    _, eager = solve(index, heur_fn=heur_matching)
+    se, lazy = solve(index, heur_fn=heur_matching, lazy_heuristic=heur_push_distance)
+    assert se.heur_calls_deferred > se.heur_calls_made
+    assert lazy.gval == eager.gval
+    assert_replays(PROBLEMS[index], lazy)
+
+
+@pytest.mark.parametrize('index', [0, 1, 2, 3, 7])
+def test_bidirectional_paths_replay_at_the_optimal_cost(index):
+    _, optimal = solve(index)
+    _, final = solve(index, 'bidirectional')
+    assert final.gval == optimal.gval
+    assert_replays(PROBLEMS[index], final)
+
+
+def test_bidirectional_start_on_a_goal():
+    problem = PROBLEMS[0]
+    start = SokobanState("START", 0, None, problem.width, problem.height, problem.robots,
+                         problem.storage, problem.storage, problem.obstacles)
+    se = SearchEngine('bidirectional', 'full')
+    se.init_search(start, sokoban_goal_state)
+    final, stats = se.search(10)
+    assert final.gval == 0
+
+
+@pytest.mark.parametrize('cc', ['none', 'path'])
+def test_bidirectional_needs_full_cycle_checking(cc):
+    with pytest.raises(ValueError):
+        SearchEngine('bidirectional', cc)
+
+
+#forgotten states keep their path records, so the bounds are looser than above
+@pytest.mark.parametrize('index, memory_bound', [
+    (0, None), (1, None), (2, None), (3, None), (7, None), (0, 30000), (1, 900000), (3, 200000)])
+@pytest.mark.parametrize('frontier', ['lazy', 'indexed'])
+def test_compact_paths_replay(index, memory_bound, frontier):
+    _, plain = solve(index)
+    se, final = solve(index, memory_bound=memory_bound, frontier=frontier, compact_paths=True)
+    assert final.gval == plain.gval
+    assert_replays(PROBLEMS[index], final)
+    if memory_bound:
+        assert se.states_forgotten > 0
+
+
+def test_spilling_closed_list_acts_like_a_dict():
+    rng = random.Random(0)
+    table = SpillingClosedList(max_in_memory=4, capacity=8, action_bytes=4)
+    reference = dict()
+    for _ in range(5000):
+        key = rng.randrange(200)
+        action = rng.random()
+        if action < 0.3:
+            table[key] = reference[key] = rng.randrange(100)
+        elif action < 0.5:
+            #path records, some of which (no parent, long action) can't be spilled
+            record = (rng.randrange(100), rng.choice([None, rng.randrange(200)]), rng.choice(['up', 'left down']))
+            table[key] = reference[key] = record
+        elif action < 0.7 and key in reference:
+            del table[key]
+            del reference[key]
+        else:
+            assert table.get(key) == reference.get(key)
+        assert len(table) == len(reference)
+    assert table.spilled > 0
+    assert sorted(table.items()) == sorted(reference.items())
+    table.close()
+
+
+@pytest.mark.parametrize('index, memory_bound, compact_paths', [
+    (1, None, False), (3, None, False), (7, None, False), (3, 200000, False), (7, 250000, False),
+    (1, None, True), (7, None, True), (3, 200000, True)])
+def test_spilling_closed_list_search_matches_memory(index, memory_bound, compact_paths):
+    results = []
+    for closed in ('memory', lambda: SpillingClosedList(max_in_memory=16, capacity=16)):
+        se = SearchEngine('astar', 'full')
+        se.set_closed(closed)
+        se.init_search(PROBLEMS[index], sokoban_goal_state, heur_manhattan_distance, compact_paths=compact_paths)
+        final, stats = se.search(30, memory_bound=memory_bound)
+        results.append((final.gval, stats.states_expanded, stats.states_generated, sorted(se.cc_dictionary.items())))
+        if compact_paths:
+            assert_replays(PROBLEMS[index], final)
+    assert results[0] == results[1]
+    assert se.cc_dictionary.spilled > 0
+    se.cc_dictionary.close()
+
+
+@pytest.mark.parametrize('index', [0, 1, 3, 7])
+def test_parallel_search_finds_the_serial_cost(index):
+    _, serial = solve(index)
+    se = SearchEngine('astar', 'full')
+    se.init_search(PROBLEMS[index], sokoban_goal_state, heur_manhattan_distance)
+    final, stats = se.parallel_search(60, workers=2)
+    assert final.gval == serial.gval
+    assert stats.time_overshoot is None
+    assert_replays(PROBLEMS[index], final)
+
+
+def lagging_heuristic(state):
+    '''heur_manhattan_distance, slowed down on the states the second of two workers owns.'''
+    if _hda_owner(state.hashable_state(), 2) == 1:
+        time.sleep(0.01)
+    return heur_manhattan_distance(state)
+
+
+def test_parallel_search_returns_its_best_goal_on_timeout():
+    #the first worker finds a goal long before the second has caught up to prove it optimal
+    se = SearchEngine('astar', 'full')
+    se.init_search(PROBLEMS[0], sokoban_goal_state, lagging_heuristic)
+    final, stats = se.parallel_search(1, workers=2)
+    assert stats.time_overshoot is not None
+    assert sokoban_goal_state(final)
+    _, serial = solve(0)
+    assert final.gval >= serial.gval
+    while final.parent is not None:
+        final = final.parent
+    assert final.hashable_state() == PROBLEMS[0].hashable_state()
+
+
+def test_parallel_search_timeout_without_a_goal():
+    se = SearchEngine('astar', 'full')
+    se.init_search(PROBLEMS[9], sokoban_goal_state, heur_manhattan_distance)
+    final, stats = se.parallel_search(0.5, workers=2)
+    assert final is False
+    assert stats.time_overshoot is not None
+    assert sum(stats.worker_expansions) > 0
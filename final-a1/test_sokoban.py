@@ -0,0 +1,124 @@
+'''Behaviour tests for the Sokoban state classes. Run with pytest from this directory.'''
+
+import pytest
+
+from search import SearchEngine
+from sokoban import SokobanState, PackedSokobanState, MacroSokobanState, sokoban_goal_state, PROBLEMS, UP, RIGHT, DOWN, LEFT
+from solution import heur_alternate, heur_manhattan_distance
+
+
+def reference_successors(state):
+    '''(robots, boxes) of each successor, built the way successors() originally built them.'''
+    result = []
+    for robot in range(0, len(state.robots)):
+        for direction in (UP, RIGHT, DOWN, LEFT):
+            new_location = direction.move(state.robots[robot])
+            others = state.robots[:robot] + state.robots[robot + 1:]
+            if not (0 <= new_location[0] < state.width and 0 <= new_location[1] < state.height):
+                continue
+            if new_location in state.obstacles or new_location in others:
+                continue
+            new_boxes = set(state.boxes)
+            if new_location in state.boxes:
+                new_box_location = direction.move(new_location)
+                if not (0 <= new_box_location[0] < state.width and 0 <= new_box_location[1] < state.height):
+                    continue
+                if new_box_location in state.obstacles or new_box_location in others or new_box_location in new_boxes:
+                    continue
+                new_boxes.remove(new_location)
+                new_boxes.add(new_box_location)
+            new_robots = list(state.robots)
+            new_robots[robot] = new_location
+            result.append((tuple(new_robots), frozenset(new_boxes)))
+    return result
+
+
+def sample_states(state, limit):
+    '''The first limit states reached breadth first from state.'''
+    seen = {state.hashable_state()}
+    states = [state]
+    for state in states:
+        for child in state.iter_successors():
+            if len(states) >= limit:
+                return states
+            if child.hashable_state() not in seen:
+                seen.add(child.hashable_state())
+                states.append(child)
+    return states
+
+
+def test_successors_match_reference_construction():
+    for problem in (PROBLEMS[3], PROBLEMS[10], PROBLEMS[18]):
+        for state in sample_states(problem, 300):
+            children = {(child.robots, child.boxes): child for child in state.iter_successors()}
+            reference = reference_successors(state)
+            assert len(children) == len(reference)
+            for robots, boxes in reference:
+                child = children[(robots, boxes)]
+                #equal states get equal values, whatever order their boxes iterate in
+                for built in (boxes, frozenset(reversed(list(boxes)))):
+                    assert heur_alternate(child) == heur_alternate(
+                        SokobanState("START", 0, None, state.width, state.height, robots, built, state.storage,
+                                     state.obstacles))
+
+
+@pytest.mark.parametrize('problem', [PROBLEMS[3], PROBLEMS[10], PROBLEMS[18]])
+def test_packed_successors_match(problem):
+    for state in sample_states(problem, 300):
+        packed = PackedSokobanState.from_state(state)
+        expected = [(child.action, child.gval, child.robots, child.boxes) for child in state.successors()]
+        assert [(child.action, child.gval, child.robots, child.boxes) for child in packed.successors()] == expected
+
+
+@pytest.mark.parametrize('problem', [PROBLEMS[3], PROBLEMS[10], PROBLEMS[18]])
+def test_decode_state_round_trips(problem):
+    for state in sample_states(problem, 300):
+        for original in (state, PackedSokobanState.from_state(state)):
+            key = original.hashable_state()
+            decoded = original.decode_state(key, original.action, original.gval)
+            assert type(decoded) is type(original)
+            assert decoded.hashable_state() == key
+            assert (decoded.robots, decoded.boxes, decoded.gval) == (original.robots, original.boxes, original.gval)
+
+
+def one_robot(state):
+    '''state with only its first robot.'''
+    return SokobanState("START", 0, None, state.width, state.height, state.robots[:1],
+                        state.boxes, state.storage, state.obstacles)
+
+
+@pytest.mark.parametrize('problem', [PROBLEMS[1], PROBLEMS[7], one_robot(PROBLEMS[0]), one_robot(PROBLEMS[3])])
+def test_macro_pushes_keep_the_optimal_cost(problem):
+    costs = []
+    for state in (problem, MacroSokobanState.from_state(problem)):
+        se = SearchEngine('astar', 'full')
+        se.init_search(state, sokoban_goal_state, heur_manhattan_distance)
+        final, stats = se.search(30)
+        costs.append(final.gval)
+    assert costs[0] == costs[1]
+
+
+def test_macro_state_needs_one_robot():
+    with pytest.raises(ValueError):
+        MacroSokobanState.from_state(PROBLEMS[3])
+
+
+#multi-robot problems that astar solves quickly with 'path' cycle checking
+@pytest.mark.parametrize('problem', [PROBLEMS[0], PROBLEMS[2], PROBLEMS[3]])
+def test_reduced_interleavings_keep_the_optimal_cost(problem, monkeypatch):
+    costs = []
+    for reduce in (False, True):
+        monkeypatch.setattr(SokobanState, 'reduce_interleavings', reduce)
+        se = SearchEngine('astar', 'path')
+        se.init_search(problem, sokoban_goal_state, heur_manhattan_distance)
+        final, stats = se.search(30)
+        costs.append(final.gval)
+    assert stats.states_suppressed > 0
+    assert costs[0] == costs[1]
+
+
+def test_reduced_interleavings_need_repeated_states_searched(monkeypatch):
+    monkeypatch.setattr(SokobanState, 'reduce_interleavings', True)
+    se = SearchEngine('astar', 'full')
+    with pytest.raises(ValueError):
+        se.init_search(PROBLEMS[0], sokoban_goal_state, heur_manhattan_distance)
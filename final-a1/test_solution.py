@@ -0,0 +1,62 @@
+'''Behaviour tests for the Sokoban heuristics. Run with pytest from this directory.'''
+
+import random
+from itertools import permutations
+
+import pytest
+
+from sokoban import SokobanState, PROBLEMS
+from solution import heur_matching, heur_manhattan_distance, heur_push_distance
+
+
+def random_walk(state, steps, seed=0):
+    '''state and the states of a random walk of steps moves from it (each after its parent).'''
+    rng = random.Random(seed)
+    states = [state]
+    for _ in range(steps):
+        #no pushes onto dead squares, after which every value would be inf
+        successors = [succ for succ in state.successors() if not succ.boxes & succ.level.dead_squares]
+        if not successors:
+            break
+        #favour pushes, so that the box configurations change often
+        pushes = [succ for succ in successors if succ.boxes != state.boxes]
+        state = rng.choice(pushes if pushes and rng.random() < 0.5 else successors)
+        states.append(state)
+    return states
+
+
+def brute_force_matching(state):
+    '''The least total push distance over every assignment of the boxes to distinct storage points.'''
+    level = state.level
+    rows = [level.push_distances[box[1] * level.width + box[0]] for box in state.boxes]
+    return min(sum(row[j] for row, j in zip(rows, storage))
+               for storage in permutations(range(len(level.storage_cells)), len(rows)))
+
+
+#[15] and [16] have more storage points than boxes
+@pytest.mark.parametrize('problem', [PROBLEMS[7], PROBLEMS[15], PROBLEMS[16], PROBLEMS[18]])
+def test_matching_is_the_optimal_assignment(problem):
+    #each state after its parent, so a push is repaired from the parent's assignment
+    for state in random_walk(problem, 1000):
+        assert heur_matching(state) == brute_force_matching(state)
+
+
+def test_matching_with_more_boxes_than_storage():
+    problem = PROBLEMS[3]
+    state = SokobanState("START", 0, None, problem.width, problem.height, problem.robots,
+                         problem.boxes | {(1, 3)}, problem.storage, problem.obstacles)
+    assert len(state.boxes) > len(state.storage)
+    assert heur_matching(state) == float('inf')
+
+
+@pytest.mark.parametrize('heur_fn', [heur_manhattan_distance, heur_push_distance])
+@pytest.mark.parametrize('problem', [PROBLEMS[2], PROBLEMS[9], PROBLEMS[15], PROBLEMS[18]])
+def test_incremental_heuristic_matches_recomputation(heur_fn, problem):
+    #carried along the whole walk, as a search carries it down a path
+    states = random_walk(problem, 1000)
+    hval = heur_fn(states[0])
+    for parent, state in zip(states, states[1:]):
+        hval = heur_fn.incremental(parent, hval, state)
+        if hval is None:
+            hval = heur_fn(state)
+        assert hval == heur_fn(state)